@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+"""Module for writing converter output files in the background.
+
+Writes are run on a small thread pool so that the next tile can be converted
+while the previous one is being written. The number of writes that can be
+waiting at the same time is limited, so the output doesn't pile up in memory
+when the disk is slower than the converter.
+"""
+
+class BackgroundWriter:
+  def __init__(self, max_workers=4, max_pending=8):
+    self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+    self.__pending = threading.BoundedSemaphore(max_pending)
+    self.__errors_lock = threading.Lock()
+    self.errors = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    # Don't hide the original exception with write errors
+    self.close(raise_errors=exc_type is None)
+
+  def submit(self, fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) in the background.
+
+    Blocks until there is room for another pending write."""
+    self.__pending.acquire()
+    try:
+      future = self.__executor.submit(fn, *args, **kwargs)
+    except:
+      self.__pending.release()
+      raise
+    future.add_done_callback(self.__done)
+    return future
+
+  def save_image(self, img, path):
+    """Saves a Pillow image to the given path in the background."""
+    return self.submit(img.save, path)
+
+  def save_region(self, region, path):
+    """Saves an anvil-parser region to the given path in the background."""
+    return self.submit(region.save, path)
+
+  def write_file(self, path, data, mode='wb'):
+    """Writes data to the given path in the background."""
+    def write():
+      with open(path, mode) as out_file:
+        out_file.write(data)
+    return self.submit(write)
+
+  def close(self, raise_errors=True):
+    """Waits for all pending writes to finish.
+
+    If any of the writes failed, an exception is raised for the first error
+    after everything else has been written."""
+    self.__executor.shutdown(wait=True)
+    if raise_errors and len(self.errors) > 0:
+      raise Exception(f'{len(self.errors)} background write(s) failed, first error: {self.errors[0]!r}') from self.errors[0]
+
+  def __done(self, future):
+    self.__pending.release()
+    error = future.exception()
+    if error is not None:
+      with self.__errors_lock:
+        self.errors.append(error)
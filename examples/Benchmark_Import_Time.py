@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import subprocess
+
+# Measures how long it takes to start Python and import the converter modules.
+# Each import is run in a new process, so nothing is cached in sys.modules, and
+# the time it takes to start Python without importing anything is subtracted.
+# Every command is run once before it is timed, so the bytecode cache is
+# written and the imports are measured the way they run normally.
+#
+# Usage: python Benchmark_Import_Time.py [runs]
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+modules = ['BlockMap', 'Tile', 'JavaWorldReader', 'ConversionTools']
+examples_dir = os.path.dirname(os.path.abspath(__file__))
+env = dict(os.environ)
+env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+def time_command(code):
+  subprocess.run([sys.executable, '-c', code], cwd=examples_dir, env=env, check=True)
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=examples_dir, env=env, check=True)
+    times.append(time.perf_counter() - start)
+  times.sort()
+  return times[len(times) // 2]
+
+baseline = time_command('pass')
+print(f'python -c pass: {baseline * 1000:.1f} ms (median of {runs})')
+
+def report(name, t):
+  # Medians of fast imports can land below the baseline from noise, so the
+  # difference is clamped at 0 and the raw median is printed next to it
+  print(f'{name}: {max(0.0, t - baseline) * 1000:.1f} ms (median {t * 1000:.1f} ms)')
+
+for module in modules:
+  t = time_command(f'import {module}')
+  report(f'import {module}', t)
+
+# The BlockMap indices are loaded the first time they are used
+t = time_command('import BlockMap; BlockMap.find_dungeons_block(1)')
+report('import BlockMap + first lookup', t)
@@ -1050,27 +1050,50 @@ blocks = [
   { 'dungeons': [ 0x01ea, 0b1000 ], 'java': [ 'minecraft:stripped_oak_log', { 'axis': 'z' } ] }
 ]
 
-blocks_by_java_id = {}
-blocks_by_dungeons_id = {}
+def build_indices():
+  """Returns dicts of the blocks by Java ID and by Dungeons ID << 4 | data value."""
+  blocks_by_java_id = {}
+  blocks_by_dungeons_id = {}
 
-for i, b in enumerate(blocks):
-  if b['java'][0] in blocks_by_java_id:
-    blocks_by_java_id[b['java'][0]].append(b)
-  else:
-    blocks_by_java_id[b['java'][0]] = [b]
+  for i, b in enumerate(blocks):
+    if b['java'][0] in blocks_by_java_id:
+      blocks_by_java_id[b['java'][0]].append(b)
+    else:
+      blocks_by_java_id[b['java'][0]] = [b]
 
-  if len(b['dungeons']) > 1:
-    if len(b['dungeons']) > 2:
-      for m in range(16):
-        if m & b['dungeons'][2] == b['dungeons'][1]:
-          blocks_by_dungeons_id[b['dungeons'][0] << 4 | m] = b
+    if len(b['dungeons']) > 1:
+      if len(b['dungeons']) > 2:
+        for m in range(16):
+          if m & b['dungeons'][2] == b['dungeons'][1]:
+            blocks_by_dungeons_id[b['dungeons'][0] << 4 | m] = b
+      else:
+        blocks_by_dungeons_id[b['dungeons'][0] << 4 | b['dungeons'][1]] = b
     else:
-      blocks_by_dungeons_id[b['dungeons'][0] << 4 | b['dungeons'][1]] = b
-  else:
-    for m in range(16):
-      blocks_by_dungeons_id[b['dungeons'][0] << 4 | m] = b
+      for m in range(16):
+        blocks_by_dungeons_id[b['dungeons'][0] << 4 | m] = b
+
+  return blocks_by_java_id, blocks_by_dungeons_id
+
+# The indices are built the first time they are needed, so importing this
+# module only loads the blocks list from its cached bytecode
+indices = None
+
+def get_indices():
+  global indices
+  if indices is None:
+    indices = build_indices()
+  return indices
+
+def __getattr__(name):
+  # blocks_by_java_id and blocks_by_dungeons_id are built on first access
+  if name == 'blocks_by_java_id':
+    return get_indices()[0]
+  if name == 'blocks_by_dungeons_id':
+    return get_indices()[1]
+  raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 def find_java_block(block):
+  blocks_by_java_id = get_indices()[0]
   namespaced_id = block.namespace + ':' + block.id
   if not namespaced_id in blocks_by_java_id:
     return None
@@ -1093,6 +1116,7 @@ def find_java_block(block):
   return None
 
 def find_dungeons_block(block_id, block_data=0):
+  blocks_by_dungeons_id = get_indices()[1]
   k = block_id << 4 | block_data
   if k in blocks_by_dungeons_id:
     return blocks_by_dungeons_id[k]
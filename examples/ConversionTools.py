@@ -1,19 +1,22 @@
-"""A collection of tools that convert Dungeons tiles to other formats and vice versa."""
+"""A collection of tools that convert Dungeons tiles to other formats and vice versa.
+
+NumPy, anvil-parser, NBT, Pillow, and the resources pack tools are only
+imported by the code that needs them, so importing this module stays fast.
+"""
 
 import os
 import time
 import json
 import re
-
-import anvil
-from nbt.nbt import *
-from PIL import Image
+import hashlib
 
 from pretty_compact_json import stringify
+from BackgroundWriter import BackgroundWriter
+from Diagnostics import Diagnostics
 from JavaWorldReader import JavaWorldReader
-from Tile import Tile, Boundary, Door, Region
+from Tile import Tile, BoundaryList, Door, Region, layout_dict, data_properties, SECTION_AIR, SECTION_UNIFORM
 from BlockMap import find_java_block, find_dungeons_block
-from ResourcesPackUtils import DungeonToJavaResourcesPack
+
 def find_tile_entity(chunk, x, y, z):
   for te in chunk.tile_entities:
     if te['x'].value == x and te['y'].value == y and te['z'].value == z:
@@ -21,6 +24,7 @@ def find_tile_entity(chunk, x, y, z):
   return None
 
 def structure_block_entity(x, y, z, mode='DATA', name='', metadata='', px=0, py=0, pz=0, sx=0, sy=0, sz=0):
+  from nbt.nbt import TAG_Compound, TAG_String, TAG_Byte, TAG_Float, TAG_Int, TAG_Long
   tile_entity = TAG_Compound()
   tile_entity.tags.extend([
     TAG_String(name='author', value='?'),
@@ -49,6 +53,92 @@ def structure_block_entity(x, y, z, mode='DATA', name='', metadata='', px=0, py=
   ])
   return tile_entity
 
+# Blocks that will break if a stucture block is placed on top of them
+structure_block_breakable_blocks = [0x3c, 0xc6]
+
+def crop_volume(volume, lo, hi):
+  """Returns the part of a (y, z, x) volume between lo and hi.
+
+  Anything outside of the volume is filled with zeros/False."""
+  import numpy as np
+  out = np.zeros([h - l for l, h in zip(lo, hi)], dtype=volume.dtype)
+  src_lo = [max(0, l) for l in lo]
+  src_hi = [min(s, h) for s, h in zip(volume.shape, hi)]
+  if all(a < b for a, b in zip(src_lo, src_hi)):
+    out[tuple(slice(a - l, b - l) for a, b, l in zip(src_lo, src_hi, lo))] = \
+      volume[tuple(slice(a, b) for a, b in zip(src_lo, src_hi))]
+  return out
+
+def find_room_for_structure_block(blocked, breakable, pos, area):
+  """Returns a free position for a structure block relative to pos, or None.
+
+  blocked and breakable are boolean (y, z, x) volumes of the tile. blocked
+  marks blocks that are not air or are already used by the converter, and
+  breakable marks blocks that would break with a structure block on top.
+  Positions outside of the tile count as air.
+
+  The area at pos and up to 48 blocks above it are checked first, then up to
+  48 blocks below it, in the same x, z order as a per-block scan would."""
+  import numpy as np
+  if area[0] <= 0 or area[1] <= 0:
+    # Doors and regions with no size on X or Z have no room at all
+    return None
+
+  px, py, pz = pos
+  lo = (py - 49, pz, px)
+  hi = (py + 49, pz + area[1], px + area[0])
+
+  # Index i of room is the y offset i - 48
+  room = ~crop_volume(blocked, lo, hi)[1:] & ~crop_volume(breakable, lo, hi)[:-1]
+  room = room[np.r_[48:97, 47:-1:-1]].transpose(0, 2, 1)
+
+  i = int(np.argmax(room))
+  if not room.flat[i]:
+    # No room found :(
+    return None
+
+  oi, x, z = np.unravel_index(i, room.shape)
+  y = int(oi) if oi < 49 else 48 - int(oi)
+  return (int(x), y, int(z))
+
+def tile_bounds(tile_dict):
+  """Returns the position and size of a tile without decoding its blocks."""
+  if isinstance(tile_dict, Tile):
+    return tile_dict.pos, tile_dict.size
+  if 'size' in tile_dict:
+    return tile_dict['pos'], tile_dict['size']
+  return [min(a, b) for a, b in zip(tile_dict['pos'], tile_dict['pos2'])], [abs(a-b) + 1 for a, b in zip(tile_dict['pos'], tile_dict['pos2'])]
+
+def tile_layout(tile_dict):
+  """Returns a copy of a tile without its blocks, planes, boundaries, or doors.
+
+  Tile objects are turned into a dict from their attributes, without encoding
+  their blocks."""
+  if not isinstance(tile_dict, Tile):
+    return layout_dict(tile_dict, data_properties + ['doors'])
+  layout = {'id': tile_dict.id, 'size': list(tile_dict.size)}
+  if tile_dict.pos != None:
+    layout['pos'] = list(tile_dict.pos)
+  if tile_dict.y != 0:
+    layout['y'] = tile_dict.y
+  if len(tile_dict.regions) > 0:
+    layout['regions'] = [r.dict() for r in tile_dict.regions]
+  return layout
+
+def tile_region_files(pos, size):
+  """Returns the coordinates of the region files that a tile overlaps."""
+  return [
+    [rx, rz]
+    for rx in range(pos[0] // 512, (pos[0] + size[0] - 1) // 512 + 1)
+    for rz in range(pos[2] // 512, (pos[2] + size[2] - 1) // 512 + 1)
+  ]
+
+def tile_content_hash(tile_dict):
+  """Returns a hash of everything in the tile that affects the converted world."""
+  if isinstance(tile_dict, Tile):
+    tile_dict = tile_dict.dict()
+  return hashlib.sha1(json.dumps(tile_dict, sort_keys=True).encode('utf-8')).hexdigest()
+
 # Colors for the plane images
 region_plane_colors = [
   ( 98, 188,  50), # Walkable, minimap
@@ -65,21 +155,61 @@ region_plane_color_names = [
  'Unwalkable, no minimap, used for walls',
 ]
 
-def closest_color(rgb, palette):
-  r, g, b = rgb
-  color_diffs = []
-  for color in palette:
-    cr, cg, cb = color
-    color_diff = sqrt(abs(r - cr)**2 + abs(g - cg)**2 + abs(b - cb)**2)
-    color_diffs.append((color_diff, color))
-  return min(color_diffs)[1]
+def closest_color_indices(pixels, palette):
+  """Returns the index of the closest palette color for each RGB pixel.
+
+  pixels can be any array with RGB values in the last dimension."""
+  import numpy as np
+  pixels = np.asarray(pixels, dtype=np.int32)
+  palette = np.asarray(palette, dtype=np.int32)
+  diffs = ((pixels[..., np.newaxis, :] - palette) ** 2).sum(axis=-1)
+  return diffs.argmin(axis=-1).astype(np.uint8)
+
+def plane_to_image(plane, width, height, palette=None):
+  """Returns a plane as an image, with colors from the palette if given."""
+  from PIL import Image
+  if palette is None:
+    return Image.frombytes('L', (width, height), bytes(plane))
+  img = Image.frombytes('P', (width, height), bytes(plane))
+  img.putpalette([c for color in palette for c in color])
+  return img.convert('RGB')
+
+def image_to_plane(img, width, height, palette=None):
+  """Returns the plane stored in an image as a bytearray.
+
+  If a palette is given, each pixel is snapped to the closest palette color and
+  the plane gets the index of that color. The image must be exactly as big as
+  the plane."""
+  import numpy as np
+  if img.size != (width, height):
+    name = getattr(img, 'filename', '') or 'image'
+    raise Exception(f'Plane {name} is {img.size[0]}x{img.size[1]}, but the tile is {width}x{height}.')
+  if palette is None:
+    pixels = np.asarray(img.convert('L'))
+  else:
+    pixels = closest_color_indices(np.asarray(img.convert('RGB')), palette)
+  return bytearray(np.ascontiguousarray(pixels, dtype=np.uint8).tobytes())
 
 class JavaWorldToObjectGroup:
   """Converter that takes a Java Edition world and creates a Dungeons object group."""
-  def __init__(self, world_dir):
+  def __init__(self, world_dir, diagnostics=None):
     self.world_dir = world_dir
     self.boundary_block = 'minecraft:barrier'
 
+    # If True, boundaries that reach the top of a tile are extended up through
+    # the world above it, even into a neighbouring tile, so they aren't cut off
+    # at the top of the tile. Boundaries can't start below the tile.
+    self.extend_boundaries_above_tile = False
+
+    # If True, tiles without a region plane or walkable plane image get planes
+    # generated from their blocks. Blocks with IDs in passable_blocks are the
+    # ones that players can walk through.
+    self.generate_missing_planes = False
+    self.passable_blocks = [0]
+
+    # Warnings are collected here and printed as a summary after converting
+    self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
   def convert(self, dict_format=True):
     """Returns a Dungeons object group, or a list of tiles, based on the Java Edition world."""
     with open(self.world_dir + '/objectgroup.json') as json_file:
@@ -87,6 +217,21 @@ class JavaWorldToObjectGroup:
 
     world = JavaWorldReader(self.world_dir)
 
+    for tile in tiles:
+      self.convert_tile(tile, world)
+
+    self.diagnostics.print_summary()
+
+    if dict_format:
+      return {'objects':[t.dict() for t in tiles]}
+    else:
+      return {'objects':tiles}
+
+  def convert_tile(self, tile, world):
+    """Reads the blocks, doors, regions, boundaries, and planes of a tile from the world."""
+    import numpy as np
+    from PIL import Image
+
     air_blocks = [
       'minecraft:air',
       'minecraft:cave_air'
@@ -103,153 +248,230 @@ class JavaWorldToObjectGroup:
     #   cx and cz are chunk coordinates. Chunks hold 16x256x16 blocks.
     #   yi and zi are iterable ranges for the Y and Z axes.
 
-    for tile in tiles:
-      # Creating these ranges here is faster than doing it for each slice/column of the tile
-      zi = range(tile.size[2])
-      yi = range(min(256, tile.size[1]))
-
-      doors = []
-
-      # For each slice of the tile along the X axis...
-      for tx in range(tile.size[0]):
-        ax = tx + tile.pos[0]
-        cx = ax // 16
-
-        # For each column of the slice along the Z axis...
-        for tz in zi:
-          az = tz + tile.pos[2]
-          cz = az // 16
-          chunk = world.chunk(cx, cz)
-          if chunk is None:
-            print(f'Warning: Missing chunk at {cx},{cz}. Blocks in this chunk will be ignored.')
+    # Creating these ranges here is faster than doing it for each slice/column of the tile
+    zi = range(tile.size[2])
+    yi = range(min(256, tile.size[1]))
+
+    # Boundary blocks are marked here and turned into boundaries after reading the tile
+    barriers = np.zeros((len(yi), tile.size[2], tile.size[0]), dtype=bool)
+
+    # For each slice of the tile along the X axis...
+    for tx in range(tile.size[0]):
+      ax = tx + tile.pos[0]
+      cx = ax // 16
+
+      # For each column of the slice along the Z axis...
+      for tz in zi:
+        az = tz + tile.pos[2]
+        cz = az // 16
+        chunk = world.chunk(cx, cz)
+        if chunk is None:
+          self.diagnostics.add('missing_chunk', f'{cx},{cz}', tile.id, [ax, az])
+          continue
+
+        # For each block in the column along the Y axis...
+        for ty in yi:
+          ay = ty + tile.pos[1]
+
+          # Get the block from the Java world chunk
+          java_block = chunk.get_block(ax % 16, ay, az % 16)
+          namespaced_id = java_block.namespace + ':' + java_block.id
+
+          # There's no reason to keep going if the block is just air
+          if namespaced_id in air_blocks:
             continue
 
-          # TODO: Handle boundaries differently. With the current implemenation,
-          # boundaries that go outside of the tile (most of the vanilla ones do...)
-          # will lose the parts that are outside of the tile.
-          current_boundary = None
+          # Handle blocks that are used for special things in this converter, like tile doors and boundaries
+          if namespaced_id == 'minecraft:structure_block':
+            entity = find_tile_entity(chunk, ax, ay, az)
+            if entity is None:
+              continue
 
-          # For each block in the column along the Y axis...
-          for ty in yi:
-            ay = ty + tile.pos[1]
+            if entity['name'].value.startswith('door:'):
+              door = Door(
+                pos = [tx + entity['posX'].value, ty + entity['posY'].value, tz + entity['posZ'].value],
+                size = [entity['sizeX'].value, entity['sizeY'].value, entity['sizeZ'].value])
+              if len(entity['name'].value) > 5:
+                door.name = entity['name'].value[5:]
+              if len(entity['metadata'].value) > 2:
+                try:
+                  door_info = json.loads(entity['metadata'].value)
+                  if 'tags' in door_info:
+                    door.tags = door_info['tags']
+                except:
+                  self.diagnostics.add('invalid_metadata', entity['name'].value, tile.id, [ax, ay, az])
+              tile.doors.append(door)
+
+            elif entity['name'].value.startswith('region:'):
+              tile_region = Region( # Note: This is a Tile.Region, not an anvil.Region
+                pos = [tx + entity['posX'].value, ty + entity['posY'].value, tz + entity['posZ'].value],
+                size = [entity['sizeX'].value, entity['sizeY'].value, entity['sizeZ'].value])
+              if len(entity['name'].value) > 7:
+                tile_region.name = entity['name'].value[7:]
+              if len(entity['metadata'].value) > 2:
+                try:
+                  region_info = json.loads(entity['metadata'].value)
+                  if 'tags' in region_info:
+                    tile_region.tags = region_info['tags']
+                  if 'type' in region_info:
+                    tile_region.type = region_info['type']
+                except:
+                  self.diagnostics.add('invalid_metadata', entity['name'].value, tile.id, [ax, ay, az])
+              tile.regions.append(tile_region)
+            continue
 
-            # Get the block from the Java world chunk
-            java_block = chunk.get_block(ax % 16, ay, az % 16)
-            namespaced_id = java_block.namespace + ':' + java_block.id
+          if namespaced_id in player_heads:
+            tile_region = Region([tx, ty, tz]) # Note: This is a Tile.Region, not an anvil.Region
+            tile_region.name = 'playerstart'
+            tile_region.tags = 'playerstart'
+            tile_region.type = 'trigger'
+            tile.regions.append(tile_region)
+            continue
 
-            # There's no reason to keep going if the block is just air
-            if namespaced_id in air_blocks:
-              continue
+          if namespaced_id == self.boundary_block:
+            barriers[ty, tz, tx] = True
+            continue
 
-            # Handle blocks that are used for special things in this converter, like tile doors and boundaries
-            if namespaced_id == 'minecraft:structure_block':
-              entity = find_tile_entity(chunk, ax, ay, az)
-              if entity is None:
-                continue
-
-              if entity['name'].value.startswith('door:'):
-                door = Door(
-                  pos = [tx + entity['posX'].value, ty + entity['posY'].value, tz + entity['posZ'].value],
-                  size = [entity['sizeX'].value, entity['sizeY'].value, entity['sizeZ'].value])
-                if len(entity['name'].value) > 5:
-                  door.name = entity['name'].value[5:]
-                if len(entity['metadata'].value) > 2:
-                  try:
-                    door_info = json.loads(entity['metadata'].value)
-                    if 'tags' in door_info:
-                      door.tags = door_info['tags']
-                  except:
-                    print(f'Warning: Invalid JSON in structure block metadata at {ax},{ay},{az}')
-                tile.doors.append(door)
-
-              elif entity['name'].value.startswith('region:'):
-                tile_region = Region( # Note: This is a Tile.Region, not an anvil.Region
-                  pos = [tx + entity['posX'].value, ty + entity['posY'].value, tz + entity['posZ'].value],
-                  size = [entity['sizeX'].value, entity['sizeY'].value, entity['sizeZ'].value])
-                if len(entity['name'].value) > 7:
-                  tile_region.name = entity['name'].value[7:]
-                if len(entity['metadata'].value) > 2:
-                  try:
-                    region_info = json.loads(entity['metadata'].value)
-                    if 'tags' in region_info:
-                      tile_region.tags = region_info['tags']
-                    if 'type' in region_info:
-                      tile_region.type = region_info['type']
-                  except:
-                    print(f'Warning: Invalid JSON in structure block metadata at {ax},{ay},{az}')
-                tile.regions.append(tile_region)
-              continue
+          # Mapped blocks have both a Java namespaced ID + state and a Dungeons ID + data value
+          mapped_block = find_java_block(java_block)
 
-            if namespaced_id in player_heads:
-              tile_region = Region([tx, ty, tz]) # Note: This is a Tile.Region, not an anvil.Region
-              tile_region.name = 'playerstart'
-              tile_region.tags = 'playerstart'
-              tile_region.type = 'trigger'
-              tile.regions.append(tile_region)
-              continue
+          if mapped_block is None:
+            props = {}
+            for prop in java_block.properties:
+              props[prop] = java_block.properties[prop].value
+            self.diagnostics.add('unmapped_java_block', namespaced_id + json.dumps(props), tile.id, [ax, ay, az])
+            continue
 
-            if namespaced_id == self.boundary_block:
-              # Check if this block is connected to the last boundary found in this column
-              if current_boundary is None or current_boundary.y + current_boundary.h != ty:
-                current_boundary = Boundary(tx, ty, tz, 1)
-                tile.boundaries.append(current_boundary)
-              else:
-                current_boundary.h += 1
-              continue
+          # Check if the block has a data value
+          if len(mapped_block['dungeons']) > 1:
+            tile.set_block(tx, ty, tz, block_id = mapped_block['dungeons'][0], block_data = mapped_block['dungeons'][1])
+          else:
+            tile.set_block(tx, ty, tz, block_id = mapped_block['dungeons'][0])
+
+    # Each run of boundary blocks in a column becomes a boundary
+    boundaries = BoundaryList.from_mask(barriers)
+    if self.extend_boundaries_above_tile:
+      for i in np.nonzero(boundaries.array['y'] + boundaries.array['h'] == len(yi))[0]:
+        b = boundaries[i]
+        ax = b.x + tile.pos[0]
+        az = b.z + tile.pos[2]
+        chunk = world.chunk(ax // 16, az // 16)
+        ay = tile.pos[1] + b.y + b.h
+        while ay < 256 and b.h < 0xffff:
+          java_block = chunk.get_block(ax % 16, ay, az % 16)
+          if java_block.namespace + ':' + java_block.id != self.boundary_block:
+            break
+          b.h += 1
+          ay += 1
+    tile.boundaries.extend(boundaries)
+
+    # Convert plane images to tile planes. Both missing planes come from one
+    # generate_planes call.
+    generated_planes = None
+    if os.path.isfile(os.path.join(self.world_dir, 'region_plane', tile.id + '.png')):
+      img = Image.open(os.path.join(self.world_dir, 'region_plane', tile.id + '.png'))
+      tile.region_plane = image_to_plane(img, tile.size[0], tile.size[2], region_plane_colors)
+    elif self.generate_missing_planes:
+      generated_planes = tile.generate_planes(self.passable_blocks)
+      tile.region_plane = generated_planes[0]
+
+    if os.path.isfile(os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png')):
+      tile.region_y_plane_copy_height = False
+      img = Image.open(os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png'))
+      tile.region_y_plane = image_to_plane(img, tile.size[0], tile.size[2])
+
+    if os.path.isfile(os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png')):
+      tile.write_walkable_plane = True
+      img = Image.open(os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png'))
+      tile.walkable_plane = image_to_plane(img, tile.size[0], tile.size[2])
+    elif self.generate_missing_planes:
+      tile.write_walkable_plane = True
+      if generated_planes is None:
+        generated_planes = tile.generate_planes(self.passable_blocks)
+      tile.walkable_plane = generated_planes[1]
+
+
+  def watched_files(self, tile_dicts):
+    """Returns the modification times of the files that the conversion reads."""
+    paths = [os.path.join(self.world_dir, 'objectgroup.json')]
+
+    if os.path.isdir(os.path.join(self.world_dir, 'region')):
+      paths.extend(e.path for e in os.scandir(os.path.join(self.world_dir, 'region')) if e.name.endswith('.mca'))
+
+    for t in tile_dicts:
+      for plane_dir in ['region_plane', 'region_y_plane', 'walkable_plane']:
+        paths.append(os.path.join(self.world_dir, plane_dir, t['id'] + '.png'))
+
+    mtimes = {}
+    for p in paths:
+      try:
+        mtimes[p] = os.stat(p).st_mtime_ns
+      except OSError:
+        pass
+    return mtimes
+
+  def watch(self, output_path, interval=1):
+    """Converts the world to an object group file and keeps it up to date.
+
+    The world is checked for changes every {interval} seconds, and only the
+    tiles that overlap changed region files, or that have changed plane images,
+    are converted again. Runs until interrupted."""
+    tile_dicts = None
+    objects = None
+    mtimes = {}
+
+    while True:
+      objectgroup_path = os.path.join(self.world_dir, 'objectgroup.json')
+      new_mtimes = self.watched_files(tile_dicts or [])
+      changed = set(p for p in new_mtimes if mtimes.get(p) != new_mtimes[p]) | (set(mtimes) - set(new_mtimes))
+
+      if tile_dicts is None or objectgroup_path in changed:
+        # The tiles themselves might have changed, so everything is converted
+        with open(objectgroup_path) as json_file:
+          tile_dicts = json.load(json_file)['objects']
+        new_mtimes = self.watched_files(tile_dicts)
+        changed_tiles = range(len(tile_dicts))
+        objects = [None] * len(tile_dicts)
 
-            # Mapped blocks have both a Java namespaced ID + state and a Dungeons ID + data value
-            mapped_block = find_java_block(java_block)
+      else:
+        changed_regions = set()
+        changed_tiles = []
+        for p in changed:
+          match = re.match(r'r\.(-?\d+)\.(-?\d+)\.mca$', os.path.basename(p))
+          if match:
+            changed_regions.add((int(match[1]), int(match[2])))
+        for i, t in enumerate(tile_dicts):
+          plane_paths = [os.path.join(self.world_dir, d, t['id'] + '.png') for d in ['region_plane', 'region_y_plane', 'walkable_plane']]
+          if any(p in changed for p in plane_paths) or any(tuple(r) in changed_regions for r in tile_region_files(*tile_bounds(t))):
+            changed_tiles.append(i)
 
-            if mapped_block is None:
-              props = {}
-              for prop in java_block.properties:
-                props[prop] = java_block.properties[prop].value
-              print(f'Warning: {java_block}{json.dumps(props)} is not mapped to anything. It will be replaced by air.')
-              continue
+      mtimes = new_mtimes
 
-            # Check if the block has a data value
-            if len(mapped_block['dungeons']) > 1:
-              tile.set_block(tx, ty, tz, block_id = mapped_block['dungeons'][0], block_data = mapped_block['dungeons'][1])
-            else:
-              tile.set_block(tx, ty, tz, block_id = mapped_block['dungeons'][0])
-
-      # Convert plane images to tile planes
-      if os.path.isfile(os.path.join(self.world_dir, 'region_plane', tile.id + '.png')):
-        img = Image.open(os.path.join(self.world_dir, 'region_plane', tile.id + '.png')).convert('RGB')
-        for x in range(tile.size[0]):
-          for z in zi:
-            pixel = img.getpixel((x, z))
-            idx = tile.get_block_index(x, 0, z)
-            if pixel in region_plane_colors:
-              tile.region_plane[idx] = region_plane_colors.index(pixel)
-            else:
-              tile.region_plane[idx] = region_plane_colors.index(closest_color(pixel, region_plane_colors))
-
-      if os.path.isfile(os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png')):
-        tile.region_y_plane_copy_height = False
-        img = Image.open(os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png')).convert('L')
-        for x in range(tile.size[0]):
-          for z in zi:
-            idx = tile.get_block_index(x, 0, z)
-            tile.region_y_plane[idx] = img.getpixel((x, z))
-
-      if os.path.isfile(os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png')):
-        tile.write_walkable_plane = True
-        img = Image.open(os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png')).convert('L')
-        for x in range(tile.size[0]):
-          for z in zi:
-            idx = tile.get_block_index(x, 0, z)
-            tile.walkable_plane[idx] = img.getpixel((x, z))
+      if len(changed_tiles) > 0:
+        start_time = time.time()
 
-    if dict_format:
-      return {'objects':[t.dict() for t in tiles]}
-    else:
-      return {'objects':tiles}
+        # A new reader is needed every time, since the cached chunks are stale
+        world = JavaWorldReader(self.world_dir)
+        for i in changed_tiles:
+          tile = Tile.from_dict(tile_dicts[i])
+          self.convert_tile(tile, world)
+          objects[i] = tile.dict()
+
+        with open(output_path, 'w') as out_file:
+          out_file.write(stringify({'objects': objects}))
+
+        print(f'Converted {len(changed_tiles)} tile(s) in {time.time() - start_time:.2f}s')
+        self.diagnostics.print_summary()
+        self.diagnostics.clear()
+
+      time.sleep(interval)
 
 
 class ObjectGroupToJavaWorld:
   """Converter that takes a Dungeons object group and creates a Java Edition world."""
-  def __init__(self, objectgroup, world_dir, resources_pack_path=None):
+  def __init__(self, objectgroup, world_dir, resources_pack_path=None, diagnostics=None):
+    import anvil
+
     self.objectgroup = objectgroup
     self.world_dir = world_dir
     self.level_name = 'Converted Object Group'
@@ -258,14 +480,38 @@ class ObjectGroupToJavaWorld:
     # If Not None, it will convert a MC Dungeon resources pack to a MC resources pack
     self.resources_pack_path = resources_pack_path
 
+    # Warnings are collected here and printed as a summary after converting
+    self.diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
     # If True, convert regions that are small enough to structure blocks
     self.region_structure_blocks = True
 
     # If True, use player heads as playerstart regions instead of structure blocks
     self.playerstart_to_player_head = True
 
+    # Number of threads used to write files in the background, and how many
+    # files can be waiting to be written before the conversion has to wait
+    self.writer_threads = 4
+    self.max_pending_writes = 8
+
+    # If True, only rebuild the region files and plane images of tiles that
+    # have changed since the last conversion to the same world directory
+    self.incremental = False
+
+  def manifest_settings(self):
+    """Returns the settings that affect the converted world, for the manifest."""
+    return {
+      'boundary_block': [self.boundary_block.namespace, self.boundary_block.id, self.boundary_block.properties],
+      'region_structure_blocks': self.region_structure_blocks,
+      'playerstart_to_player_head': self.playerstart_to_player_head,
+    }
+
   def convert(self):
     """Creates a Java Edition world in the world directory from the object group."""
+    import numpy as np
+    import anvil
+    from nbt.nbt import NBTFile, TAG_Compound, TAG_String, TAG_Byte, TAG_Int
+
     # TODO: Converting to a Java world should be done one region or maybe even
     # one sub-region at a time. Right now, all regions are kept
     # in memory until the conversion process is done, which means the memory
@@ -288,30 +534,6 @@ class ObjectGroupToJavaWorld:
     structure_block = anvil.Block('minecraft', 'structure_block')
     player_head = anvil.Block('minecraft', 'player_head')
 
-    def find_room_for_structure_block(area, get_block):
-      xi = range(area[0])
-      zi = range(area[1])
-
-      # Blocks that will break if a stucture block is placed on top of them
-      breakable_blocks = [0x3c, 0xc6]
-
-      # Check the area and blocks above it
-      for y in range(49):
-        for x in xi:
-          for z in zi:
-            if get_block(x, y, z) == 0 and not get_block(x, y - 1, z) in breakable_blocks:
-              return (x, y, z)
-
-      # Check blocks below the area
-      for y in range(-1, -49, -1):
-        for x in xi:
-          for z in zi:
-            if get_block(x, y, z) == 0 and not get_block(x, y - 1, z) in breakable_blocks:
-              return (x, y, z)
-
-      # No room found :(
-      return None
-
     if isinstance(self.objectgroup, dict):
       og = self.objectgroup
 
@@ -323,211 +545,246 @@ class ObjectGroupToJavaWorld:
     os.makedirs(os.path.join(self.world_dir, 'region_y_plane'), exist_ok=True)
     os.makedirs(os.path.join(self.world_dir, 'walkable_plane'), exist_ok=True)
 
-    for tile_dict in og['objects']:
-      if isinstance(tile_dict, Tile):
-        tile = tile_dict
-      else:
-        tile = Tile.from_dict(tile_dict)
-
-      zi = range(tile.size[2])
-      yi = range(min(256, tile.size[1]))
-
-      # For each slice of the tile along the X axis...
-      for tx in range(tile.size[0]):
-        ax = tx + tile.pos[0]
-        rx = ax // 512
+    # The manifest stores a hash of each tile and the region files it was
+    # written to, so the next incremental conversion knows what has changed
+    manifest_path = os.path.join(self.world_dir, 'converter_manifest.json')
+    settings = json.loads(json.dumps(self.manifest_settings()))
+    tile_ids = [t.id if isinstance(t, Tile) else t['id'] for t in og['objects']]
+    tile_hashes = {tid: tile_content_hash(t) for tid, t in zip(tile_ids, og['objects'])}
+    tile_regions = {tid: tile_region_files(*tile_bounds(t)) for tid, t in zip(tile_ids, og['objects'])}
+
+    # If these are None, everything is rebuilt
+    changed_tiles = None
+    dirty_regions = None
+
+    if self.incremental and os.path.isfile(manifest_path):
+      with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+
+      if len(tile_hashes) < len(tile_ids):
+        print('Warning: Tile IDs are not unique, so the whole world will be rebuilt.')
+
+      elif manifest['settings'] == settings:
+        old_tiles = manifest['tiles']
+        changed_tiles = set(tid for tid in tile_ids if not tid in old_tiles or old_tiles[tid]['hash'] != tile_hashes[tid])
+        removed_tiles = set(old_tiles) - set(tile_ids)
+
+        # Regions need to be rebuilt where changed tiles are now and where
+        # changed or removed tiles used to be
+        dirty_regions = set()
+        for tid in changed_tiles:
+          dirty_regions.update(tuple(r) for r in tile_regions[tid])
+        for tid in changed_tiles | removed_tiles:
+          if tid in old_tiles:
+            dirty_regions.update(tuple(r) for r in old_tiles[tid]['regions'])
+
+        for tid in removed_tiles:
+          for plane_dir in ['region_plane', 'region_y_plane', 'walkable_plane']:
+            plane_path = os.path.join(self.world_dir, plane_dir, tid + '.png')
+            if os.path.isfile(plane_path):
+              os.remove(plane_path)
+
+    # Plane images and regions are written in the background while the next
+    # tile is being converted. Leaving the with block waits for everything to
+    # be written, and raises if any of the writes failed.
+    with BackgroundWriter(self.writer_threads, self.max_pending_writes) as writer:
+      for tid, tile_dict in zip(tile_ids, og['objects']):
+        # Unchanged tiles only need to be converted again if they share a region
+        # file with a changed tile, since region files are rebuilt from scratch
+        if dirty_regions is not None and not tid in changed_tiles and dirty_regions.isdisjoint(tuple(r) for r in tile_regions[tid]):
+          continue
+
+        if isinstance(tile_dict, Tile):
+          tile = tile_dict
+        else:
+          tile = Tile.from_dict(tile_dict)
+
+        tile_blocks = tile.get_block_volume()
+        tile_keys = tile_blocks.astype(np.uint32) << 4 | tile.get_data_volume()
+        section_states, section_keys = tile.get_section_map()
+
+        # Only the part of the tile that is inside of the world bounds is converted
+        y_start = max(0, -tile.pos[1])
+        y_end = min(256, tile.size[1], 256 - tile.pos[1])
+
+        # Sections with only air are skipped completely
+        for sy, sz, sx in zip(*np.nonzero(section_states != SECTION_AIR)):
+          y0, y1 = max(y_start, sy * 16), min(y_end, sy * 16 + 16)
+          z0, z1 = sz * 16, min(tile.size[2], sz * 16 + 16)
+          x0, x1 = sx * 16, min(tile.size[0], sx * 16 + 16)
+          if y0 >= y1:
+            continue
 
-        # For each column of the slice along the Z axis...
-        for tz in zi:
-          az = tz + tile.pos[2]
-          rz = az // 512
-          region = get_region(rx, rz)
+          if section_states[sy, sz, sx] == SECTION_UNIFORM:
+            ys, zs, xs = [a.reshape(-1) for a in np.indices((y1 - y0, z1 - z0, x1 - x0))]
+            keys = np.full(len(ys), section_keys[sy, sz, sx])
+          else: # Mixed sections only visit the blocks that aren't air
+            ys, zs, xs = np.nonzero(tile_blocks[y0:y1, z0:z1, x0:x1])
+            keys = tile_keys[y0:y1, z0:z1, x0:x1][ys, zs, xs]
 
-          # For each block in the column along the Y axis...
-          for ty in yi:
+          for ty, tz, tx, bcid in zip((ys + y0).tolist(), (zs + z0).tolist(), (xs + x0).tolist(), keys.tolist()):
+            ax = tx + tile.pos[0]
             ay = ty + tile.pos[1]
-
-            # Skip this block if it's outside of the world bounds
-            if ay < 0 or ay >= 256:
-              continue
-
-            bidx = tile.get_block_index(tx, ty, tz)
-
-            # If the block is just air, we don't need to do anything
-            if tile.blocks[bidx] == 0:
-              continue
+            az = tz + tile.pos[2]
 
             # Get the Java block from the cache if it's there
-            bcid = tile.blocks[bidx] << 4 | tile.block_data[bidx]
             if bcid in block_cache:
               java_block = block_cache[bcid]
 
             else: # If not, find it and add it to the cache to speed things up later
-              mapped_block = find_dungeons_block(tile.blocks[bidx], tile.block_data[bidx])
+              mapped_block = find_dungeons_block(bcid >> 4, bcid & 0xf)
 
               if mapped_block is None:
-                print(f'Warning: {tile.blocks[bidx]}:{tile.block_data[bidx]} is not mapped to anything. It will be replaced by air.')
-                continue
-
-              if len(mapped_block['java']) > 1:
+                java_block = None # Unmapped blocks are cached too
+              elif len(mapped_block['java']) > 1:
                 java_block = anvil.Block(*mapped_block['java'][0].split(':', 1), mapped_block['java'][1])
               else:
                 java_block = anvil.Block(*mapped_block['java'][0].split(':', 1))
 
               block_cache[bcid] = java_block
 
+            if java_block is None:
+              self.diagnostics.add('unmapped_dungeons_block', f'{bcid >> 4}:{bcid & 0xf}', tile.id, [ax, ay, az])
+              continue
+
             # Once we have the Java block, add it to the region
-            region.set_block(java_block, ax, ay, az)
+            get_region(ax // 512, az // 512).set_block(java_block, ax, ay, az)
 
-      # TODO: Block post-processing to fix fences, walls, stairs, and more
+        # TODO: Block post-processing to fix fences, walls, stairs, and more
 
-      converter_blocks = []
+        # Occupancy volumes used to find room for structure blocks. Blocks placed
+        # by the converter are marked as blocked as they are added.
+        blocked = tile_blocks != 0
+        breakable = np.isin(tile_blocks, structure_block_breakable_blocks)
 
-      # Add the tile doors to the world
-      for door in tile.doors:
-        def get_block(x, y, z):
-          tx = x + door.pos[0]
-          ty = y + door.pos[1]
-          tz = z + door.pos[2]
-          if f'{tx},{ty},{tz}' in converter_blocks:
-            return -1
+        def mark_used(tx, ty, tz):
           if tx >= 0 and tx < tile.size[0] and ty >= 0 and ty < tile.size[1] and tz >= 0 and tz < tile.size[2]:
-            return tile.get_block_id(tx, ty, tz)
-          else:
-            return 0
-        pos = find_room_for_structure_block(door.size[::2], get_block)
+            blocked[ty, tz, tx] = True
 
-        if pos is None:
-          if hasattr(door, 'name'):
-            print(f'Warning: No room to place structure block for door: {door.name}')
-          else:
-            print(f'Warning: No room to place structure block for unnamed door.')
+        # Add the tile doors to the world
+        for door in tile.doors:
+          pos = find_room_for_structure_block(blocked, breakable, door.pos, door.size[::2])
 
-        else:
-          tpos = [p + d for p, d in zip(pos, door.pos)]
-          if tpos[0] >= 0 and tpos[0] < tile.size[0] and tpos[1] >= 0 and tpos[1] < tile.size[1] and tpos[2] >= 0 and tpos[2] < tile.size[2]:
-            apos = [p + t for p, t in zip(tpos, tile.pos)]
-            region = get_region(apos[0] // 512, apos[2] // 512)
-            region.set_block(structure_block, *apos)
-            metadata = door.dict()
-            metadata.pop('name', None)
-            metadata.pop('pos', None)
-            metadata.pop('size', None)
-            if hasattr(door, 'name'):
-              tile_entity = structure_block_entity(*apos, 'SAVE', f'door:{door.name}', json.dumps(metadata), *[-v for v in pos], *door.size)
-            else:
-              tile_entity = structure_block_entity(*apos, 'SAVE', 'door:', json.dumps(metadata), *[-v for v in pos], *door.size)
-            region.chunks[apos[2] // 16 % 32 * 32 + apos[0] // 16 % 32].tile_entities.append(tile_entity)
-            converter_blocks.append(f'{tpos[0]},{tpos[1]},{tpos[2]}')
-
-      if self.region_structure_blocks:
-        # Add the tile regions to the world
-        for tile_region in tile.regions:
-          # playerstart regions just use a player head instead of a structure block
-          if self.playerstart_to_player_head and hasattr(tile_region, 'tags') and tile_region.tags == 'playerstart':
-            ax = tile.pos[0] + tile_region.pos[0]
-            ay = tile.pos[1] + tile_region.pos[1]
-            az = tile.pos[2] + tile_region.pos[2]
-            rx = ax // 512
-            rz = az // 512
-            region = get_region(rx, rz)
-            region.set_block(player_head, ax, ay, az)
-            tile_entity = TAG_Compound()
-            tile_entity.tags.extend([
-              TAG_String(name='id', value='minecraft:skull'),
-              TAG_Byte(name='keepPacked', value=0),
-              TAG_Int(name='x', value=ax),
-              TAG_Int(name='y', value=ay),
-              TAG_Int(name='z', value=az)
-            ])
-            region.chunks[az // 16 % 32 * 32 + ax // 16 % 32].tile_entities.append(tile_entity)
-            converter_blocks.append(f'{tile_region.pos[0]},{tile_region.pos[1]},{tile_region.pos[2]}')
-
-          elif tile_region.size[0] <= 48 and tile_region.size[1] <= 48 and tile_region.size[2] <= 48:
-            def get_block(x, y, z):
-              tx = x + tile_region.pos[0]
-              ty = y + tile_region.pos[1]
-              tz = z + tile_region.pos[2]
-              if f'{tx},{ty},{tz}' in converter_blocks:
-                return -1
-              if tx >= 0 and tx < tile.size[0] and ty >= 0 and ty < tile.size[1] and tz >= 0 and tz < tile.size[2]:
-                return tile.get_block_id(tx, ty, tz)
+          if pos is None:
+            self.diagnostics.add('no_room_for_structure_block', f'door:{door.name}' if hasattr(door, 'name') else 'door:', tile.id, [p + t for p, t in zip(door.pos, tile.pos)])
+
+          else:
+            tpos = [p + d for p, d in zip(pos, door.pos)]
+            if tpos[0] >= 0 and tpos[0] < tile.size[0] and tpos[1] >= 0 and tpos[1] < tile.size[1] and tpos[2] >= 0 and tpos[2] < tile.size[2]:
+              apos = [p + t for p, t in zip(tpos, tile.pos)]
+              region = get_region(apos[0] // 512, apos[2] // 512)
+              region.set_block(structure_block, *apos)
+              metadata = door.dict()
+              metadata.pop('name', None)
+              metadata.pop('pos', None)
+              metadata.pop('size', None)
+              if hasattr(door, 'name'):
+                tile_entity = structure_block_entity(*apos, 'SAVE', f'door:{door.name}', json.dumps(metadata), *[-v for v in pos], *door.size)
               else:
-                return 0
-            pos = find_room_for_structure_block(tile_region.size[::2], get_block)
+                tile_entity = structure_block_entity(*apos, 'SAVE', 'door:', json.dumps(metadata), *[-v for v in pos], *door.size)
+              region.chunks[apos[2] // 16 % 32 * 32 + apos[0] // 16 % 32].tile_entities.append(tile_entity)
+              mark_used(*tpos)
+
+        if self.region_structure_blocks:
+          # Add the tile regions to the world
+          for tile_region in tile.regions:
+            # playerstart regions just use a player head instead of a structure block
+            if self.playerstart_to_player_head and hasattr(tile_region, 'tags') and tile_region.tags == 'playerstart':
+              ax = tile.pos[0] + tile_region.pos[0]
+              ay = tile.pos[1] + tile_region.pos[1]
+              az = tile.pos[2] + tile_region.pos[2]
+              rx = ax // 512
+              rz = az // 512
+              region = get_region(rx, rz)
+              region.set_block(player_head, ax, ay, az)
+              tile_entity = TAG_Compound()
+              tile_entity.tags.extend([
+                TAG_String(name='id', value='minecraft:skull'),
+                TAG_Byte(name='keepPacked', value=0),
+                TAG_Int(name='x', value=ax),
+                TAG_Int(name='y', value=ay),
+                TAG_Int(name='z', value=az)
+              ])
+              region.chunks[az // 16 % 32 * 32 + ax // 16 % 32].tile_entities.append(tile_entity)
+              mark_used(*tile_region.pos)
+
+            elif tile_region.size[0] <= 48 and tile_region.size[1] <= 48 and tile_region.size[2] <= 48:
+              pos = find_room_for_structure_block(blocked, breakable, tile_region.pos, tile_region.size[::2])
+
+              if pos is None:
+                self.diagnostics.add('no_room_for_structure_block', f'region:{tile_region.name}' if hasattr(tile_region, 'name') else 'region:', tile.id, [p + t for p, t in zip(tile_region.pos, tile.pos)])
 
-            if pos is None:
-              if hasattr(tile_region, 'name'):
-                print(f'Warning: No room to place structure block for region: {tile_region.name}')
               else:
-                print(f'Warning: No room to place structure block for unnamed region.')
-
-            else:
-              tpos = [p + d for p, d in zip(pos, tile_region.pos)]
-              if tpos[0] >= 0 and tpos[0] < tile.size[0] and tpos[1] >= 0 and tpos[1] < tile.size[1] and tpos[2] >= 0 and tpos[2] < tile.size[2]:
-                apos = [p + t for p, t in zip(tpos, tile.pos)]
-                region = get_region(apos[0] // 512, apos[2] // 512)
-                region.set_block(structure_block, *apos)
-                metadata = tile_region.dict()
-                metadata.pop('name', None)
-                metadata.pop('pos', None)
-                metadata.pop('size', None)
-                if hasattr(tile_region, 'name'):
-                  tile_entity = structure_block_entity(*apos, 'SAVE', f'region:{tile_region.name}', json.dumps(metadata), *[-v for v in pos], *tile_region.size)
-                else:
-                  tile_entity = structure_block_entity(*apos, 'SAVE', 'region:', json.dumps(metadata), *[-v for v in pos], *tile_region.size)
-                region.chunks[apos[2] // 16 % 32 * 32 + apos[0] // 16 % 32].tile_entities.append(tile_entity)
-                converter_blocks.append(f'{tpos[0]},{tpos[1]},{tpos[2]}')
-
-      # Add the tile boundaries to the world
-      for boundary in tile.boundaries:
-        ax = tile.pos[0] + boundary.x
-        az = tile.pos[2] + boundary.z
-        rx = ax // 512
-        rz = az // 512
-        region = get_region(rx, rz)
-
-        for by in range(boundary.h):
-          ay = tile.pos[1] + boundary.y + by
-
-          region.set_block(self.boundary_block, ax, ay, az)
-
-      # Convert the planes to images, so they can be edited easily
-      region_plane_img = Image.new('RGB', (tile.size[0], tile.size[2]))
-      region_y_plane_img = Image.new('L', (tile.size[0], tile.size[2]))
-      walkable_plane_img = Image.new('L', (tile.size[0], tile.size[2]))
-      for x in range(tile.size[0]):
-        for z in zi:
-          idx = tile.get_block_index(x, 0, z)
-          region_plane_img.putpixel((x, z), region_plane_colors[tile.region_plane[idx]])
-          region_y_plane_img.putpixel((x, z), tile.region_y_plane[idx])
-          walkable_plane_img.putpixel((x, z), tile.walkable_plane[idx])
-
-      region_plane_img.save(os.path.join(self.world_dir, 'region_plane', tile.id + '.png'))
-      region_y_plane_img.save(os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png'))
-      walkable_plane_img.save(os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png'))
-
-    with open(os.path.join(self.world_dir, 'region_plane', '_README.txt'), 'w') as region_plane_readme:
-      region_plane_readme.write('Region plane colors:\n\n')
-      region_plane_readme.write('\n'.join([('#%02x%02x%02x' % c) + f': {n}' for c, n in zip(region_plane_colors, region_plane_color_names)]))
-
-    # Write regions to files
-    os.makedirs(os.path.join(self.world_dir, 'region'), exist_ok=True)
-    for k in region_cache:
-      region_cache[k].save(os.path.join(self.world_dir, f'region/r.{region_cache[k].x}.{region_cache[k].z}.mca'))
+                tpos = [p + d for p, d in zip(pos, tile_region.pos)]
+                if tpos[0] >= 0 and tpos[0] < tile.size[0] and tpos[1] >= 0 and tpos[1] < tile.size[1] and tpos[2] >= 0 and tpos[2] < tile.size[2]:
+                  apos = [p + t for p, t in zip(tpos, tile.pos)]
+                  region = get_region(apos[0] // 512, apos[2] // 512)
+                  region.set_block(structure_block, *apos)
+                  metadata = tile_region.dict()
+                  metadata.pop('name', None)
+                  metadata.pop('pos', None)
+                  metadata.pop('size', None)
+                  if hasattr(tile_region, 'name'):
+                    tile_entity = structure_block_entity(*apos, 'SAVE', f'region:{tile_region.name}', json.dumps(metadata), *[-v for v in pos], *tile_region.size)
+                  else:
+                    tile_entity = structure_block_entity(*apos, 'SAVE', 'region:', json.dumps(metadata), *[-v for v in pos], *tile_region.size)
+                  region.chunks[apos[2] // 16 % 32 * 32 + apos[0] // 16 % 32].tile_entities.append(tile_entity)
+                  mark_used(*tpos)
+
+        # Add the tile boundaries to the world
+        for boundary in tile.boundaries:
+          ax = tile.pos[0] + boundary.x
+          az = tile.pos[2] + boundary.z
+          rx = ax // 512
+          rz = az // 512
+          region = get_region(rx, rz)
+
+          for by in range(boundary.h):
+            ay = tile.pos[1] + boundary.y + by
+
+            region.set_block(self.boundary_block, ax, ay, az)
+
+        if changed_tiles is not None and not tid in changed_tiles:
+          continue
+
+        # Convert the planes to images, so they can be edited easily
+        region_plane_img = plane_to_image(tile.region_plane, tile.size[0], tile.size[2], region_plane_colors)
+        region_y_plane_img = plane_to_image(tile.region_y_plane, tile.size[0], tile.size[2])
+        walkable_plane_img = plane_to_image(tile.walkable_plane, tile.size[0], tile.size[2])
+
+        writer.save_image(region_plane_img, os.path.join(self.world_dir, 'region_plane', tile.id + '.png'))
+        writer.save_image(region_y_plane_img, os.path.join(self.world_dir, 'region_y_plane', tile.id + '.png'))
+        writer.save_image(walkable_plane_img, os.path.join(self.world_dir, 'walkable_plane', tile.id + '.png'))
+
+      with open(os.path.join(self.world_dir, 'region_plane', '_README.txt'), 'w') as region_plane_readme:
+        region_plane_readme.write('Region plane colors:\n\n')
+        region_plane_readme.write('\n'.join([('#%02x%02x%02x' % c) + f': {n}' for c, n in zip(region_plane_colors, region_plane_color_names)]))
+
+      # Write regions to files
+      os.makedirs(os.path.join(self.world_dir, 'region'), exist_ok=True)
+      for k in region_cache:
+        if dirty_regions is None or (region_cache[k].x, region_cache[k].z) in dirty_regions:
+          writer.save_region(region_cache[k], os.path.join(self.world_dir, f'region/r.{region_cache[k].x}.{region_cache[k].z}.mca'))
+
+      # Remove region files that no longer have any tiles in them
+      if dirty_regions is not None:
+        for rx, rz in dirty_regions:
+          region_path = os.path.join(self.world_dir, f'region/r.{rx}.{rz}.mca')
+          if not f'{rx}x{rz}' in region_cache and os.path.isfile(region_path):
+            os.remove(region_path)
+
+    with open(manifest_path, 'w') as manifest_file:
+      json.dump({
+        'settings': settings,
+        'tiles': {tid: {'hash': tile_hashes[tid], 'regions': tile_regions[tid]} for tid in tile_ids}
+      }, manifest_file)
 
     # For convenience, write the object group to objectgroup.json in the world
     # directory, so JavaWorldToObjectGroup can convert the world back to an
     # object group without any changes.
-    og_copy = json.loads(json.dumps(og)) # faster than copy.deepcopy
+    og_copy = layout_dict(og, ['objects'])
+    og_copy['objects'] = [tile_layout(t) for t in og['objects']]
     for tile in og_copy['objects']:
-      tile.pop('blocks', None)
-      tile.pop('boundaries', None)
-      tile.pop('doors', None)
-      tile.pop('height-plane', None)
-      tile.pop('region-plane', None)
-      tile.pop('region-y-plane', None)
-      tile.pop('walkable-plane', None)
       if self.region_structure_blocks and 'regions' in tile:
         # Keep only regions that are too big turn into structure blocks
         tile['regions'] = [r for r in tile['regions'] if r['size'][0] > 48 or r['size'][1] > 48 or r['size'][2] > 48]
@@ -542,13 +799,17 @@ class ObjectGroupToJavaWorld:
     # Place the player spawn above the center of the first tile.
     # This could probably be made a bit smarter, since the center of the tile
     # might still be above the void. For now, this faster solution will have to do.
-    level['Data']['SpawnX'].value = int(og['objects'][0]['pos'][0] + og['objects'][0]['size'][0] * 0.5)
-    level['Data']['SpawnY'].value = min(255, og['objects'][0]['pos'][1] + og['objects'][0]['size'][1])
-    level['Data']['SpawnZ'].value = int(og['objects'][0]['pos'][2] + og['objects'][0]['size'][2] * 0.5)
+    spawn_pos, spawn_size = tile_bounds(og['objects'][0])
+    level['Data']['SpawnX'].value = int(spawn_pos[0] + spawn_size[0] * 0.5)
+    level['Data']['SpawnY'].value = min(255, spawn_pos[1] + spawn_size[1])
+    level['Data']['SpawnZ'].value = int(spawn_pos[2] + spawn_size[2] * 0.5)
 
     level.write_file(os.path.join(self.world_dir, 'level.dat'))
 
+    self.diagnostics.print_summary()
+
     if self.resources_pack_path is not None:
+      from ResourcesPackUtils import DungeonToJavaResourcesPack
       print("Resource pack")
       DungeonToJavaResourcesPack(resource_pack_path=self.resources_pack_path,
                                  dest_path=os.path.join(self.world_dir, "resources"),
@@ -0,0 +1,87 @@
+from pretty_compact_json import stringify
+
+"""Module for collecting warnings from the converters.
+
+Instead of printing a line for every block that has a problem, the converters
+add each problem to a Diagnostics object. Problems of the same kind, with the
+same subject, in the same tile are counted together, and only the first few
+coordinates are kept as samples:
+
+  diagnostics = Diagnostics()
+  diagnostics.add('unmapped_java_block', 'minecraft:dirt_path{}', 'tile_01', [1, 2, 3])
+  print(diagnostics.summary())
+"""
+
+# Descriptions used in the summary for the kinds added by the converters
+kind_descriptions = {
+  'missing_chunk': 'Missing chunk. Blocks in this chunk were ignored. Counted per column.',
+  'unmapped_java_block': 'Java block is not mapped to anything. It was replaced by air.',
+  'unmapped_dungeons_block': 'Dungeons block is not mapped to anything. It was replaced by air.',
+  'invalid_metadata': 'Invalid JSON in structure block metadata.',
+  'no_room_for_structure_block': 'No room to place structure block.',
+}
+
+class Diagnostics:
+  def __init__(self, max_samples=5):
+    self.max_samples = max_samples
+    self.clear()
+
+  def clear(self):
+    """Removes everything that has been added."""
+    # (kind, subject, tile ID) -> [count, samples]
+    self.entries = {}
+
+  def add(self, kind, subject, tile_id=None, pos=None):
+    """Counts one occurrence of a problem.
+
+    subject is what the problem is about, e.g. a block state or a door name.
+    pos is kept as a sample if fewer than max_samples have been kept so far."""
+    key = (kind, subject, tile_id)
+    entry = self.entries.get(key)
+    if entry is None:
+      entry = self.entries[key] = [0, []]
+    entry[0] += 1
+    if pos is not None and len(entry[1]) < self.max_samples:
+      entry[1].append(list(pos))
+
+  def __len__(self):
+    return len(self.entries)
+
+  def count(self, kind=None):
+    """Returns the total number of occurrences, optionally of one kind only."""
+    return sum(e[0] for k, e in self.entries.items() if kind is None or k[0] == kind)
+
+  def report(self):
+    """Returns a list of dicts, one for each (kind, subject, tile ID), sorted by kind and count."""
+    entries = sorted(self.entries.items(), key=lambda e: (e[0][0], -e[1][0]))
+    return [{
+      'kind': k[0],
+      'subject': k[1],
+      'tile': k[2],
+      'count': e[0],
+      'samples': e[1],
+    } for k, e in entries]
+
+  def write_json(self, path):
+    """Writes the report to a JSON file."""
+    with open(path, 'w') as out_file:
+      out_file.write(stringify(self.report()))
+
+  def summary(self):
+    """Returns the report as a table, with the kinds described above each group."""
+    lines = []
+    kind = None
+    for entry in self.report():
+      if entry['kind'] != kind:
+        kind = entry['kind']
+        lines.append(f'{kind_descriptions.get(kind, kind)} ({self.count(kind)})')
+      samples = ' '.join(','.join(str(v) for v in s) for s in entry['samples'])
+      tile = entry['tile'] if entry['tile'] is not None else '-'
+      lines.append(f'  {entry["count"]:>8}  {tile:<24}  {entry["subject"]}  {samples}')
+    return '\n'.join(lines)
+
+  def print_summary(self):
+    """Prints the summary, if anything has been added."""
+    if len(self.entries) > 0:
+      print('Warnings:')
+      print(self.summary())
@@ -1,5 +1,4 @@
 from collections import OrderedDict
-import anvil
 
 """Module for optimized reading of Minecraft Java Edition worlds.
 
@@ -17,6 +16,8 @@ class JavaWorldReader:
     self.__chunk_cache = OrderedDict()
 
   def chunk(self, cx, cz):
+    import anvil # Imported here so importing this module stays fast
+
     try:
       if f'{cx}x{cz}' in self.__chunk_cache:
         return self.__chunk_cache[f'{cx}x{cz}']
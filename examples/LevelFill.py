@@ -0,0 +1,113 @@
+import math
+import numpy as np
+
+"""Module for previewing the fill of a level without starting the game.
+
+The fill is made up of bands of gradient blocks around the tiles of a level,
+where the width of each band comes from the fill.world.gradient property of
+the level (see docs/Level.md). This module finds the distance from every
+block around the tiles to the closest tile, and uses it to pick a band:
+
+  bands, origin = fill_bands(tiles, level['fill']['world']['gradient'])
+  fill_image(bands).save('fill.png')
+
+The game varies the widths of the bands, so the preview shows their average
+shape.
+"""
+
+# Colors of the 17 bands in the preview image. The 17th band uses the first
+# gradient block in the game, so it gets the same color as the first one.
+band_colors = [(int(255 - i * 12), int(200 - i * 10), int(60 + i * 8)) for i in range(16)]
+band_colors.append(band_colors[0])
+tile_color = (90, 90, 90)
+empty_color = (0, 0, 0)
+
+def level_gradient(level):
+  """Returns the fill.world.gradient property of a level dict, or None if it
+  doesn't have one."""
+  fill = level.get('fill')
+  if not isinstance(fill, dict):
+    return None
+  return fill.get('world', {}).get('gradient')
+
+def tile_footprint(tile):
+  """Returns the X, Z position and X, Z size of a Tile object or tile dict."""
+  if isinstance(tile, dict):
+    if 'size' in tile:
+      pos, size = tile['pos'], tile['size']
+    else:
+      pos = [min(a, b) for a, b in zip(tile['pos'], tile['pos2'])]
+      size = [abs(a - b) + 1 for a, b in zip(tile['pos'], tile['pos2'])]
+  else:
+    pos, size = tile.pos, tile.size
+  return pos[0], pos[2], size[0], size[2]
+
+def distance_transform(mask, max_distance):
+  """Returns the Euclidean distance from each cell of a 2D boolean array to the
+  closest True cell. Distances above max_distance are not exact, but they are
+  always above max_distance.
+
+  The distances along the first axis are found with running maximums of the
+  positions of True cells, and then each cell takes the minimum over the cells
+  within max_distance along the second axis."""
+  rows, cols = mask.shape
+  limit = int(math.ceil(max_distance)) + 1
+  # Columns without a True cell before or after a cell get at least limit
+  far = rows + limit
+
+  # Distance to the closest True cell in the same column
+  index = np.arange(rows)[:, np.newaxis]
+  before = np.maximum.accumulate(np.where(mask, index, -far), axis=0)
+  after = np.minimum.accumulate(np.where(mask, index, far)[::-1], axis=0)[::-1]
+  column = np.minimum(np.minimum(index - before, after - index), limit)
+  # Squared distances up to 2 * limit * limit, which usually fit in 16 bits
+  dtype = np.uint16 if 2 * limit * limit < 65536 else np.int32
+  squared = (column * column).astype(dtype)
+
+  # Squared distance with the columns up to limit cells away
+  result = squared.copy()
+  shifted = np.empty_like(squared)
+  for k in range(1, min(limit, cols - 1) + 1):
+    np.add(squared[:, :-k], dtype(k * k), out=shifted[:, k:])
+    np.minimum(result[:, k:], shifted[:, k:], out=result[:, k:])
+    np.add(squared[:, k:], dtype(k * k), out=shifted[:, :-k])
+    np.minimum(result[:, :-k], shifted[:, :-k], out=result[:, :-k])
+  return np.sqrt(result, dtype=np.float32)
+
+def fill_bands(tiles, gradient):
+  """Returns the fill band of each block around the tiles, as a (z, x) NumPy
+  array, and the world [x, z] coordinates of the first block in it.
+
+  Blocks in tiles are -2, blocks outside of the fill are -1, and the other
+  blocks are the index of their band. All bands after the 16th are band 16."""
+  widths = np.asarray(gradient, dtype=np.float64)
+  edges = np.cumsum(widths)
+  total = float(edges[-1]) if len(edges) > 0 else 0.0
+  margin = int(math.ceil(total)) + 1
+
+  footprints = [tile_footprint(t) for t in tiles]
+  if len(footprints) == 0:
+    return np.full((0, 0), -1, dtype=np.int8), [0, 0]
+  x0 = min(f[0] for f in footprints) - margin
+  z0 = min(f[1] for f in footprints) - margin
+  x1 = max(f[0] + f[2] for f in footprints) + margin
+  z1 = max(f[1] + f[3] for f in footprints) + margin
+
+  inside = np.zeros((z1 - z0, x1 - x0), dtype=bool)
+  for x, z, sx, sz in footprints:
+    inside[z - z0:z - z0 + sz, x - x0:x - x0 + sx] = True
+
+  distances = distance_transform(inside, total)
+  # Clamped before the cast, so gradients with more than 127 bands don't wrap
+  bands = np.minimum(np.searchsorted(edges, distances, side='left'), 16).astype(np.int8)
+  bands[distances > total] = -1
+  bands[inside] = -2
+  return bands, [x0, z0]
+
+def fill_image(bands):
+  """Returns a top-down Pillow image of the fill bands from fill_bands."""
+  from PIL import Image
+  palette = np.asarray(band_colors + [tile_color, empty_color], dtype=np.uint8)
+  # -2 (tiles) and -1 (no fill) index the last two colors
+  pixels = palette[bands.astype(np.intp) % len(palette)]
+  return Image.fromarray(np.ascontiguousarray(pixels), 'RGB')
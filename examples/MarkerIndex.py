@@ -0,0 +1,171 @@
+"""Module for finding the doors and regions of a level by position, name, or tag.
+
+MarkerIndex keeps the doors and regions of a list of tiles in a grid over
+world coordinates, so it doesn't need to go through every marker to find the
+ones at a position:
+
+  index = MarkerIndex(tiles)
+  for m in index.at_point(10, 20, 30, kind='region'):
+    print(m.tile.id, m.marker.name)
+
+When doors or regions are added, removed, or changed, update() indexes the
+tiles that changed again. Markers are boxes that start at their pos and are
+size blocks big, so a box contains pos but not pos + size.
+"""
+
+class IndexedMarker:
+  """A door or region in a MarkerIndex, with its box in world coordinates."""
+  def __init__(self, tile, kind, marker, min, max):
+    self.tile = tile
+    self.kind = kind # 'door' or 'region'
+    self.marker = marker
+    self.min = min
+    self.max = max
+
+  def contains(self, x, y, z):
+    return self.min[0] <= x < self.max[0] and self.min[1] <= y < self.max[1] and self.min[2] <= z < self.max[2]
+
+  def intersects(self, min, max):
+    return self.min[0] < max[0] and min[0] < self.max[0] and self.min[1] < max[1] and min[1] < self.max[1] and self.min[2] < max[2] and min[2] < self.max[2]
+
+
+def marker_tags(marker):
+  """Returns the tags of a door or region. Tags are separated by commas."""
+  if not hasattr(marker, 'tags') or not marker.tags:
+    return []
+  return [t.strip() for t in marker.tags.split(',') if t.strip()]
+
+def tile_markers(tile):
+  """Returns (kind, marker) for each door and region of a tile."""
+  return [('door', d) for d in tile.doors] + [('region', r) for r in tile.regions]
+
+def marker_signature(tile):
+  """Returns a value that changes when the position or any marker of the tile changes."""
+  return (tuple(tile.pos or [0, 0, 0]),) + tuple(
+    (kind, id(m), tuple(m.pos), tuple(m.size), getattr(m, 'name', None), getattr(m, 'tags', None))
+    for kind, m in tile_markers(tile))
+
+
+class MarkerIndex:
+  def __init__(self, tiles = (), cell_size = 32):
+    self.cell_size = cell_size
+    self.__entries = {} # entry ID -> IndexedMarker
+    self.__cells = {} # (cell x, cell z) -> set of entry IDs
+    self.__names = {} # name -> set of entry IDs
+    self.__tags = {} # tag -> set of entry IDs
+    self.__keys = {} # entry ID -> (name, tags) when the marker was added
+    self.__tiles = {} # tile -> (signature, entry IDs)
+    self.__next_id = 0
+    for tile in tiles:
+      self.add_tile(tile)
+
+  def __len__(self):
+    return len(self.__entries)
+
+  def __cell_range(self, min, max):
+    # Cells that a box from min up to max overlaps on the X and Z axes
+    cs = self.cell_size
+    return [(cx, cz)
+      for cx in range(min[0] // cs, (max[0] - 1) // cs + 1)
+      for cz in range(min[2] // cs, (max[2] - 1) // cs + 1)]
+
+  def add_tile(self, tile):
+    """Adds the doors and regions of a tile to the index."""
+    if tile in self.__tiles:
+      self.remove_tile(tile)
+
+    tpos = tile.pos or [0, 0, 0]
+    ids = []
+    for kind, marker in tile_markers(tile):
+      # Markers are at least one block big, so they can be found by position
+      min_ = [p + t for p, t in zip(marker.pos, tpos)]
+      max_ = [m + max(1, s) for m, s in zip(min_, marker.size)]
+      entry_id = self.__next_id
+      self.__next_id += 1
+      self.__entries[entry_id] = IndexedMarker(tile, kind, marker, min_, max_)
+      ids.append(entry_id)
+
+      for cell in self.__cell_range(min_, max_):
+        self.__cells.setdefault(cell, set()).add(entry_id)
+      name = getattr(marker, 'name', None)
+      if name is not None:
+        self.__names.setdefault(name, set()).add(entry_id)
+      tags = marker_tags(marker)
+      for tag in tags:
+        self.__tags.setdefault(tag, set()).add(entry_id)
+      self.__keys[entry_id] = (name, tags)
+
+    self.__tiles[tile] = (marker_signature(tile), ids)
+
+  def remove_tile(self, tile):
+    """Removes the doors and regions of a tile from the index."""
+    if not tile in self.__tiles:
+      return
+
+    for entry_id in self.__tiles.pop(tile)[1]:
+      entry = self.__entries.pop(entry_id)
+      name, tags = self.__keys.pop(entry_id)
+      for cell in self.__cell_range(entry.min, entry.max):
+        self.__discard(self.__cells, cell, entry_id)
+      if name is not None:
+        self.__discard(self.__names, name, entry_id)
+      for tag in tags:
+        self.__discard(self.__tags, tag, entry_id)
+
+  @staticmethod
+  def __discard(sets, key, entry_id):
+    sets[key].discard(entry_id)
+    if len(sets[key]) == 0:
+      del sets[key]
+
+  def update(self, tiles = None):
+    """Indexes the tiles whose doors or regions have changed again.
+
+    If a list of tiles is given, tiles that aren't in it are removed from the
+    index and new tiles are added. Returns the number of tiles that were
+    indexed again."""
+    if tiles is not None:
+      tiles = list(tiles)
+      kept = set(tiles)
+      for tile in [t for t in self.__tiles if not t in kept]:
+        self.remove_tile(tile)
+    else:
+      tiles = list(self.__tiles)
+
+    changed = 0
+    for tile in tiles:
+      if not tile in self.__tiles or self.__tiles[tile][0] != marker_signature(tile):
+        self.add_tile(tile)
+        changed += 1
+    return changed
+
+  def __results(self, ids, kind):
+    return [self.__entries[i] for i in sorted(ids) if kind is None or self.__entries[i].kind == kind]
+
+  def at_point(self, x, y, z, kind = None):
+    """Returns the markers that contain the given world coordinates."""
+    cell = self.__cells.get((x // self.cell_size, z // self.cell_size), ())
+    return self.__results([i for i in cell if self.__entries[i].contains(x, y, z)], kind)
+
+  def in_box(self, pos, size, kind = None):
+    """Returns the markers that intersect the box at pos with the given size."""
+    max_ = [p + s for p, s in zip(pos, size)]
+    cs = self.cell_size
+    cell_count = ((max_[0] - 1) // cs - pos[0] // cs + 1) * ((max_[2] - 1) // cs - pos[2] // cs + 1)
+    if cell_count > len(self.__cells):
+      # Checking every marker is faster than going through that many cells
+      return self.__results([i for i, e in self.__entries.items() if e.intersects(pos, max_)], kind)
+
+    ids = set()
+    for cell in self.__cell_range(pos, max_):
+      if cell in self.__cells:
+        ids.update(i for i in self.__cells[cell] if not i in ids and self.__entries[i].intersects(pos, max_))
+    return self.__results(ids, kind)
+
+  def with_name(self, name, kind = None):
+    """Returns the markers with the given name."""
+    return self.__results(self.__names.get(name, ()), kind)
+
+  def with_tag(self, tag, kind = None):
+    """Returns the markers that have the given tag."""
+    return self.__results(self.__tags.get(tag, ()), kind)
@@ -0,0 +1,223 @@
+import numpy as np
+from Tile import decompress, unpack_nibbles, data_properties
+
+"""Module for finding what changed between two versions of an object group.
+
+Tiles are matched by their id. Compressed properties that are the same string
+in both versions are skipped without being decompressed, so only the tiles
+that actually changed cost anything:
+
+  diff = diff_objectgroups(old_objectgroup, new_objectgroup)
+  print(diff_summary(diff))
+
+For each changed tile, the diff has the number of voxels whose block ID or
+data value changed and the box around them, the number of changed cells and
+their box for each plane, the boundaries that were added or removed, and the
+old and new values of every other property. Boxes are in tile coordinates.
+"""
+
+# Planes are compared cell by cell. The height plane is generated from the
+# blocks, but it's compared too since it's what the game reads.
+plane_properties = ['region-plane', 'region-y-plane', 'walkable-plane', 'height-plane']
+
+def tile_size(dict_tile):
+  """Returns the size of a tile dict."""
+  if 'size' in dict_tile:
+    return list(dict_tile['size'])
+  return [abs(a - b) + 1 for a, b in zip(dict_tile['pos'], dict_tile['pos2'])]
+
+def decode_blocks(compressed, volume):
+  """Returns the block IDs and data values of a compressed blocks property as
+  two NumPy arrays of {volume} values each."""
+  decompressed = decompress(compressed)
+  # Same rule as Tile.from_dict: more than 2 bytes per block means 16-bit IDs
+  if len(decompressed) > volume * 2:
+    ids = np.frombuffer(decompressed, dtype='>u2', count=volume).astype(np.uint16)
+    data_bytes = memoryview(decompressed)[volume * 2:]
+  else:
+    ids = np.frombuffer(decompressed, dtype=np.uint8, count=volume).astype(np.uint16)
+    data_bytes = memoryview(decompressed)[volume:]
+  return ids, unpack_nibbles(data_bytes)[:volume]
+
+def change_box(changed):
+  """Returns the smallest box around the True values of a (y, z, x) or (z, x)
+  boolean array as a dict with pos and size, in [x, y, z] or [x, z] order, or
+  None if nothing changed."""
+  pos, size = [], []
+  for axis in range(changed.ndim):
+    other = tuple(a for a in range(changed.ndim) if a != axis)
+    hits = np.flatnonzero(changed.any(axis=other))
+    if len(hits) == 0:
+      return None
+    pos.append(int(hits[0]))
+    size.append(int(hits[-1] - hits[0]) + 1)
+  # Arrays are in YZX or ZX order
+  return {'pos': pos[::-1] if changed.ndim == 2 else [pos[2], pos[0], pos[1]],
+          'size': size[::-1] if changed.ndim == 2 else [size[2], size[0], size[1]]}
+
+def boundary_keys(compressed_or_list):
+  """Returns the boundaries of a tile dict as a sorted array of 64-bit keys."""
+  if compressed_or_list is None:
+    return np.zeros(0, dtype=np.uint64)
+  if isinstance(compressed_or_list, list): # Old uncompressed boundaries format
+    b = np.asarray(compressed_or_list, dtype='>u2').reshape(-1, 4)
+    raw = b.tobytes()
+  else:
+    raw = decompress(compressed_or_list)
+  # Each boundary is 4 big-endian 16-bit values, so 8 bytes make one key
+  return np.unique(np.frombuffer(raw[:len(raw) // 8 * 8], dtype='>u8'))
+
+def diff_blocks(old_blocks, new_blocks, size):
+  """Returns the number of changed voxels, IDs, and data values and the box
+  around the changed voxels, or None if both blocks properties are the same."""
+  if old_blocks == new_blocks:
+    return None
+  volume = size[0] * size[1] * size[2]
+  old_ids, old_data = decode_blocks(old_blocks, volume)
+  new_ids, new_data = decode_blocks(new_blocks, volume)
+  ids_changed = old_ids != new_ids
+  data_changed = old_data != new_data
+  changed = ids_changed | data_changed
+  count = int(np.count_nonzero(changed))
+  if count == 0: # Same blocks, compressed differently
+    return None
+  return {
+    'voxels': count,
+    'ids': int(np.count_nonzero(ids_changed)),
+    'data': int(np.count_nonzero(data_changed)),
+    'box': change_box(changed.reshape(size[1], size[2], size[0])),
+  }
+
+def diff_plane(old_plane, new_plane, size):
+  """Returns the number of changed cells of a plane and the box around them,
+  or None if both versions of the plane are the same."""
+  if old_plane == new_plane:
+    return None
+  if old_plane is None or new_plane is None:
+    return {'added' if old_plane is None else 'removed': True}
+  cells = size[0] * size[2]
+  old_values = np.frombuffer(decompress(old_plane), dtype=np.uint8)[:cells]
+  new_values = np.frombuffer(decompress(new_plane), dtype=np.uint8)[:cells]
+  if len(old_values) != len(new_values):
+    return {'cells': cells, 'box': {'pos': [0, 0], 'size': [size[0], size[2]]}}
+  changed = old_values != new_values
+  count = int(np.count_nonzero(changed))
+  if count == 0:
+    return None
+  return {'cells': count, 'box': change_box(changed.reshape(size[2], size[0]))}
+
+def diff_boundaries(old_boundaries, new_boundaries):
+  """Returns the number of boundaries that were added and removed, or None if
+  they are the same."""
+  if old_boundaries == new_boundaries:
+    return None
+  old_keys = boundary_keys(old_boundaries)
+  new_keys = boundary_keys(new_boundaries)
+  added = len(np.setdiff1d(new_keys, old_keys, assume_unique=True))
+  removed = len(np.setdiff1d(old_keys, new_keys, assume_unique=True))
+  if added == 0 and removed == 0:
+    return None
+  return {'added': added, 'removed': removed}
+
+def diff_metadata(old, new, exclude = ()):
+  """Returns {key: [old value, new value]} for the keys of two dicts whose
+  values are different. Missing values are None."""
+  keys = [k for k in old if not k in exclude] + [k for k in new if not k in old and not k in exclude]
+  return {k: [old.get(k), new.get(k)] for k in keys if old.get(k) != new.get(k)}
+
+def diff_tiles(old_tile, new_tile):
+  """Returns the differences between two versions of a tile dict, or None if
+  there aren't any.
+
+  If the size of the tile changed, the blocks and planes can't be compared
+  voxel by voxel, so only the properties are compared and resized is True."""
+  diff = {'id': new_tile['id']}
+  old_size, new_size = tile_size(old_tile), tile_size(new_tile)
+  if old_size != new_size:
+    diff['resized'] = True
+  else:
+    blocks = diff_blocks(old_tile.get('blocks'), new_tile.get('blocks'), new_size) \
+      if 'blocks' in old_tile and 'blocks' in new_tile else None
+    if blocks is not None:
+      diff['blocks'] = blocks
+    elif ('blocks' in old_tile) != ('blocks' in new_tile):
+      diff['blocks'] = {'added' if 'blocks' in new_tile else 'removed': True}
+
+    planes = {}
+    for name in plane_properties:
+      plane = diff_plane(old_tile.get(name), new_tile.get(name), new_size)
+      if plane is not None:
+        planes[name] = plane
+    if len(planes) > 0:
+      diff['planes'] = planes
+
+  boundaries = diff_boundaries(old_tile.get('boundaries'), new_tile.get('boundaries'))
+  if boundaries is not None:
+    diff['boundaries'] = boundaries
+
+  metadata = diff_metadata(old_tile, new_tile, data_properties)
+  if len(metadata) > 0:
+    diff['metadata'] = metadata
+
+  return diff if len(diff) > 1 else None
+
+def diff_objectgroups(old_objectgroup, new_objectgroup):
+  """Returns the differences between two versions of an object group dict.
+
+  The result has the IDs of added and removed tiles, a list of tile diffs
+  from diff_tiles for the tiles that changed, the number of unchanged tiles,
+  and the changed properties of the object group itself."""
+  old_tiles = {t['id']: t for t in old_objectgroup.get('objects', [])}
+  new_tiles = [t for t in new_objectgroup.get('objects', [])]
+  new_ids = set(t['id'] for t in new_tiles)
+
+  changed = []
+  unchanged = 0
+  for tile in new_tiles:
+    old_tile = old_tiles.get(tile['id'])
+    if old_tile is None:
+      continue
+    tile_diff = None if old_tile is tile else diff_tiles(old_tile, tile)
+    if tile_diff is None:
+      unchanged += 1
+    else:
+      changed.append(tile_diff)
+
+  return {
+    'added': [t['id'] for t in new_tiles if not t['id'] in old_tiles],
+    'removed': [tid for tid in old_tiles if not tid in new_ids],
+    'changed': changed,
+    'unchanged': unchanged,
+    'metadata': diff_metadata(old_objectgroup, new_objectgroup, ['objects']),
+  }
+
+def diff_summary(diff):
+  """Returns a diff from diff_objectgroups as readable text, one line per change."""
+  lines = []
+  for tid in diff['added']:
+    lines.append(f'+ {tid}')
+  for tid in diff['removed']:
+    lines.append(f'- {tid}')
+  for t in diff['changed']:
+    lines.append(f'~ {t["id"]}')
+    if t.get('resized'):
+      lines.append('    resized')
+    if 'blocks' in t:
+      b = t['blocks']
+      if 'voxels' in b:
+        lines.append(f'    blocks: {b["voxels"]} voxels ({b["ids"]} IDs, {b["data"]} data values) in {b["box"]["size"]} at {b["box"]["pos"]}')
+      else:
+        lines.append(f'    blocks: {", ".join(b)}')
+    for name, p in t.get('planes', {}).items():
+      if 'cells' in p:
+        lines.append(f'    {name}: {p["cells"]} cells in {p["box"]["size"]} at {p["box"]["pos"]}')
+      else:
+        lines.append(f'    {name}: {", ".join(p)}')
+    if 'boundaries' in t:
+      lines.append(f'    boundaries: +{t["boundaries"]["added"]} -{t["boundaries"]["removed"]}')
+    for key in t.get('metadata', {}):
+      lines.append(f'    {key} changed')
+  for key in diff['metadata']:
+    lines.append(f'objectgroup {key} changed')
+  lines.append(f'{len(diff["changed"])} changed, {len(diff["added"])} added, {len(diff["removed"])} removed, {diff["unchanged"]} unchanged')
+  return '\n'.join(lines)
@@ -1,8 +1,13 @@
+import json
+import hashlib
 import tempfile
-from shutil import copy2, make_archive
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
+from PIL import Image
 import BlockMap as BlockMap
-from os import makedirs, path
+from os import makedirs, path, replace, stat
 
 """
 MCD = MineCraft Dungeon
@@ -14,7 +19,8 @@ MCJ_PACK_ICON = "pack.png"
 MCJ_PACK_META = "pack.mcmeta"
 
 MCD_BLOCK_FOLDER = path.join("images", "blocks")
-MCJ_BLOCK_FOLDER = path.join("assets", "minecraft", "textures", "block")
+# Paths inside of the zip file always use forward slashes
+MCJ_BLOCK_FOLDER = "assets/minecraft/textures/block"
 
 additional_dict = {
     'stonebrick': 'stone_bricks',
@@ -206,56 +212,159 @@ Ignored:
 """
 
 
+def build_texture_index():
+    """
+    Returns a dict of Dungeons texture names to Java texture names.
+    Names of Java blocks in the block map are used as they are, and
+    additional_dict is used for everything else.
+    """
+    index = dict(additional_dict)
+    for java_id, java_blocks in BlockMap.blocks_by_java_id.items():
+        if java_id.startswith("minecraft:"):
+            index[java_id[10:]] = java_blocks[0]['java'][0][10:]
+    return index
+
+
+def read_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def file_hash(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def tga_to_png(src, dest):
+    """Converts a TGA texture to PNG. Runs on a worker thread or process."""
+    # Write to a temporary file first, so an interrupted build can't leave a
+    # broken texture in the cache
+    Image.open(src).save(dest + ".tmp", "PNG")
+    replace(dest + ".tmp", dest)
+    return dest
+
+
+class TgaCache:
+    """
+    On-disk cache of TGA textures converted to PNG.
+    Converted textures are stored by the hash of the source file, and the
+    hashes are stored by source path and modification time, so unchanged
+    textures don't even need to be read to find them in the cache.
+
+    Textures are converted on a thread pool by default. With use_processes,
+    a process pool is used instead, which is faster for big packs, but the
+    script that uses it must start its work under an
+    if __name__ == "__main__": guard, since worker processes import it again
+    on Windows and macOS.
+    """
+
+    def __init__(self, cache_dir, max_workers=None, use_processes=False):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.index_path = path.join(cache_dir, "index.json")
+
+    def convert(self, sources):
+        """Returns a dict of source paths to converted PNG paths."""
+        makedirs(self.cache_dir, exist_ok=True)
+
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            index = {}
+
+        pngs = {}
+        missing = {}
+        for src in sources:
+            key = str(Path(src).resolve())
+            mtime = stat(src).st_mtime_ns
+            if key in index and index[key][0] == mtime:
+                source_hash = index[key][1]
+            else:
+                source_hash = file_hash(src)
+                index[key] = [mtime, source_hash]
+
+            png = path.join(self.cache_dir, source_hash + ".png")
+            pngs[src] = png
+            if not path.isfile(png):
+                missing[png] = src
+
+        if len(missing) > 0:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            with executor_class(max_workers=self.max_workers) as executor:
+                for _ in executor.map(tga_to_png, [str(s) for s in missing.values()], missing.keys()):
+                    pass
+
+        with open(self.index_path, "w") as index_file:
+            json.dump(index, index_file)
+
+        return pngs
+
+
 class DungeonToJavaResourcesPack:
 
-    def __init__(self, resource_pack_path, dest_path, verbose=False):
+    def __init__(self, resource_pack_path, dest_path, verbose=False, max_workers=8, tga_cache_dir=None, tga_processes=False):
         self.dest_path = dest_path
         self.verbose = verbose
         self.path = resource_pack_path
+        self.max_workers = max_workers
+        # Converted TGA textures are kept here between builds. The cache is
+        # keyed by the hashes of the textures, so every pack can share it, and
+        # it is kept out of dest_path, which can be inside a Minecraft world.
+        self.tga_cache_dir = tga_cache_dir if tga_cache_dir is not None else path.join(tempfile.gettempdir(), "dungeons_tga_cache")
+        # Converts TGA textures in worker processes, see TgaCache
+        self.tga_processes = tga_processes
         if verbose:
             print("from ", self.path, " to ", self.dest_path)
 
     def convert(self):
-        # Creating temp folder to store the resources
-        f = tempfile.TemporaryDirectory()
+        texture_index = build_texture_index()
 
-        if self.verbose:
-            print("Temp directory created ", f.name)
+        # Take all textures (.tga and .png) from the directory given. PNG
+        # textures come last, so they are used if there is a TGA texture with
+        # the same name.
+        blocks_folder = Path(path.join(self.path, MCD_BLOCK_FOLDER))
+        blocks_path = list(blocks_folder.glob('*.tga')) + list(blocks_folder.glob('*.png'))
 
-        # Creating directory to store blocks textures
-        makedirs(path.join(f.name, MCJ_BLOCK_FOLDER))
-
-        # Copying icon pack
-        copy2(path.join(self.path, MCD_PACK_ICON), path.join(f.name, MCJ_PACK_ICON))
-
-        # Creating meta description file
-        meta = open(path.join(f.name, MCJ_PACK_META), "w")
-        meta.write('{ "pack": { "pack_format": 5, "description": "auto generated resources pack" } }')
-        meta.close()
+        # Find the Java name of every block texture. If more than one texture
+        # has the same Java name, the last one is used.
+        textures = {}
+        for block in blocks_path:
+            java_name = texture_index.get(block.stem)
+            if java_name is not None:
+                textures[MCJ_BLOCK_FOLDER + "/" + java_name + ".png"] = block
+            elif self.verbose is True:
+                print(block.stem, " not recognized")
 
-        # Take all textures (.png) from the directory give. TODO: convert TGA
-        blocks_path = Path(path.join(self.path, MCD_BLOCK_FOLDER)).glob('*.png')
+        # Convert TGA textures to PNG, or get them from the cache
+        tga_textures = [b for b in textures.values() if b.suffix == ".tga"]
+        if len(tga_textures) > 0:
+            pngs = TgaCache(self.tga_cache_dir, use_processes=self.tga_processes).convert(tga_textures)
+            textures = {name: pngs.get(block, block) for name, block in textures.items()}
+            if self.verbose:
+                print(len(tga_textures), " TGA textures converted or found in the cache")
 
-        # Iterate though all blocs
-        for block in blocks_path:
-            # Try to found the id
-            java_block = BlockMap.blocks_by_java_id.get("minecraft:" + block.stem)
-            if java_block is not None:
-                block_name = java_block[0]['java'][0]
-                # Cpy in the directory
-                copy2(block.absolute(), path.join(f.name, MCJ_BLOCK_FOLDER, block_name[10:len(block_name)] + ".png"))
-            else:
-                # Check the additional dict
-                java_block = additional_dict.get(block.stem)
+        # Write the pack straight to the archive, while the textures are read
+        # on a thread pool
+        with zipfile.ZipFile(self.dest_path + ".zip", "w", zipfile.ZIP_DEFLATED) as pack, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Copying icon pack
+            pack.write(path.join(self.path, MCD_PACK_ICON), MCJ_PACK_ICON)
 
-                if java_block is not None:
-                    # Cpy in the directory
-                    copy2(block.absolute(), path.join(f.name, MCJ_BLOCK_FOLDER, java_block + ".png"))
-                elif self.verbose is True:
-                    print(block.stem, " not recognized")
-        # Create the archive
-        make_archive(self.dest_path, 'zip', f.name)
+            # Creating meta description file
+            pack.writestr(MCJ_PACK_META, '{ "pack": { "pack_format": 5, "description": "auto generated resources pack" } }')
 
-        # delete the temp directory
-        f.cleanup()
+            # Only a few textures are read ahead of the writer, so the whole
+            # pack is never in memory at once
+            pending = deque()
+            for name, block in textures.items():
+                pending.append((name, executor.submit(read_file, block)))
+                if len(pending) > self.max_workers * 2:
+                    name, future = pending.popleft()
+                    pack.writestr(name, future.result())
+            for name, future in pending:
+                pack.writestr(name, future.result())
 
+        if self.verbose:
+            print("Resources pack written to ", self.dest_path + ".zip")
@@ -0,0 +1,188 @@
+import sys
+import atexit
+import weakref
+from array import array
+from multiprocessing import shared_memory
+import numpy as np
+from Tile import Tile, Door, Region, BoundaryList, data_values
+
+"""Module for sharing tiles between processes without copying them.
+
+The blocks, data values, and planes of a tile are stored in one shared memory
+segment. SharedTile creates the segment, and its handle is a small, picklable
+object that worker processes can use to attach to the same memory:
+
+  with SharedTile(tile) as shared:
+    executor.map(work, [shared.handle])
+
+  def work(handle):
+    with handle.attach() as shared:
+      shared.tile.set_block(0, 0, 0, 1)
+
+Doors, regions, and boundaries are copied into the handle, so changes to them
+in workers are not shared. Changes to blocks and planes are.
+
+The process that creates the segment also removes it, when the SharedTile is
+closed or garbage collected. When a SharedTile is closed, the blocks and planes
+are copied out of shared memory, so the tile can still be used after that.
+"""
+
+def attach_segment(name):
+  """Attaches to an existing segment without taking ownership of it."""
+  if sys.version_info >= (3, 13):
+    return shared_memory.SharedMemory(name=name, track=False)
+  # Before Python 3.13, attaching also registers the segment with the resource
+  # tracker. Processes started by multiprocessing share the tracker of the
+  # process that created the segment, so this doesn't change who removes it.
+  return shared_memory.SharedMemory(name=name)
+
+# Segments that couldn't be closed yet, as (segment, views)
+deferred_segments = []
+
+def close_segment(segment, views):
+  """Releases the views and detaches from the segment. Returns False if that
+  isn't possible yet, because NumPy arrays or other buffers that use the
+  views still exist."""
+  try:
+    for view in views:
+      view.release()
+    segment.close()
+  except BufferError:
+    return False
+  views.clear()
+  return True
+
+def close_deferred_segments():
+  """Tries again to close the segments that couldn't be closed before."""
+  deferred_segments[:] = [(s, v) for s, v in deferred_segments if not close_segment(s, v)]
+
+atexit.register(close_deferred_segments)
+
+def release_segment(segment, views, tile, owner):
+  """Copies the blocks and planes of the tile out of the views, and then
+  releases the views and detaches from the segment. If owner is True, the
+  segment is also removed.
+
+  The tile is copied out and the segment is removed first, so neither
+  depends on the views being released. If arrays made from the views still
+  exist, e.g. by get_block_volume, detaching is retried when the next
+  segment is released and when Python exits. The memory is freed once the
+  last process detaches."""
+  if tile is not None:
+    tile.blocks = array('H', views[0].tobytes())
+    tile.block_data = bytearray(views[1])
+    tile.region_plane = bytearray(views[2])
+    tile.region_y_plane = bytearray(views[3])
+    tile.walkable_plane = bytearray(views[4])
+
+  if owner:
+    segment.unlink()
+
+  close_deferred_segments()
+  if not close_segment(segment, views):
+    deferred_segments.append((segment, views))
+
+
+class SharedTileHandle:
+  """Picklable reference to a tile in shared memory."""
+  def __init__(self, name, meta):
+    self.name = name
+    self.meta = meta
+
+  def attach(self):
+    """Returns a SharedTile with a tile that uses the shared memory."""
+    return SharedTile(handle=self)
+
+
+class SharedTile:
+  def __init__(self, tile=None, handle=None):
+    if tile is not None:
+      self.owner = True
+      size = tile.size
+      volume = size[0] * size[1] * size[2]
+      meta = {
+        'id': tile.id,
+        'size': list(size),
+        'pos': tile.pos,
+        'y': tile.y,
+        'region_y_plane_copy_height': tile.region_y_plane_copy_height,
+        'write_walkable_plane': tile.write_walkable_plane,
+        'write_is_leaky': tile.write_is_leaky,
+        'doors': [d.dict() for d in tile.doors],
+        'regions': [r.dict() for r in tile.regions],
+        'boundaries': BoundaryList(tile.boundaries).tobytes(),
+      }
+      self.segment = shared_memory.SharedMemory(create=True, size=max(1, self.segment_size(size)))
+      self.handle = SharedTileHandle(self.segment.name, meta)
+
+      blocks, block_data = tile.palette_storage.to_arrays() if tile.palette_storage is not None else (tile.blocks, tile.block_data)
+      buf = np.frombuffer(self.segment.buf, dtype=np.uint8)
+      offsets = self.offsets(size)
+      buf[offsets[0]:offsets[1]] = np.frombuffer(blocks, dtype=np.uint8)
+      buf[offsets[1]:offsets[2]] = data_values(block_data, volume)
+      for i, plane in enumerate([tile.region_plane, tile.region_y_plane, tile.walkable_plane]):
+        buf[offsets[2 + i]:offsets[3 + i]] = np.frombuffer(plane, dtype=np.uint8)[:offsets[3 + i] - offsets[2 + i]]
+      del buf
+
+      self.tile = tile
+    else:
+      self.owner = False
+      self.handle = handle
+      self.segment = attach_segment(handle.name)
+
+      # An empty tile is created first, so every property has a value, and
+      # then the arrays are replaced by views of the shared memory
+      meta = handle.meta
+      self.tile = Tile(meta['id'], [0, 0, 0])
+      self.tile.size = list(meta['size'])
+      self.tile.volume = meta['size'][0] * meta['size'][1] * meta['size'][2]
+      self.tile.pos = meta['pos']
+      self.tile.y = meta['y']
+      self.tile.region_y_plane_copy_height = meta['region_y_plane_copy_height']
+      self.tile.write_walkable_plane = meta['write_walkable_plane']
+      self.tile.write_is_leaky = meta['write_is_leaky']
+      self.tile.doors = [Door.from_dict(d) for d in meta['doors']]
+      self.tile.regions = [Region.from_dict(r) for r in meta['regions']]
+      self.tile.boundaries = BoundaryList.from_bytes(meta['boundaries'])
+
+    # Replace the arrays of the tile with views of the shared memory
+    offsets = self.offsets(self.tile.size)
+    self.views = [self.segment.buf[a:b] for a, b in zip(offsets, offsets[1:])]
+    self.views[0] = self.views[0].cast('H')
+    self.tile.palette_storage = None
+    self.tile.blocks, self.tile.block_data, self.tile.region_plane, self.tile.region_y_plane, self.tile.walkable_plane = self.views
+
+    # Closing and garbage collection both go through the finalizer, which
+    # doesn't keep a reference to the SharedTile itself
+    self.finalizer = weakref.finalize(self, release_segment, self.segment, self.views, self.tile, self.owner)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  @staticmethod
+  def segment_size(size):
+    return SharedTile.offsets(size)[-1]
+
+  @staticmethod
+  def offsets(size):
+    """Returns where the blocks, data values, and planes start in the segment."""
+    volume = size[0] * size[1] * size[2]
+    area = size[0] * size[2]
+    return [0, volume * 2, volume * 3, volume * 3 + area, volume * 3 + area * 2, volume * 3 + area * 3]
+
+  def close(self):
+    """Copies the blocks and planes out of shared memory and detaches from it.
+
+    If this SharedTile created the segment, the segment is also removed. NumPy
+    arrays created from the tile's blocks or planes while it was shared, e.g.
+    by get_block_volume, keep using the shared memory until they are deleted.
+    See release_segment."""
+    if self.segment is None:
+      return
+
+    self.finalizer()
+    self.views = []
+    self.segment = None
@@ -1,7 +1,6 @@
 import zlib
 import base64
 from array import array
-from itertools import chain, zip_longest
 
 """
 This module contains useful classes for different tile-related objects.
@@ -16,14 +15,271 @@ optimized better.
 def decompress(s):
   return zlib.decompress(base64.b64decode(s))
 
+def decompress_ranges(s, ranges, stop = None, chunk_size = 1 << 20):
+  """Decompresses s and returns the bytes in each of the given (start, end)
+  ranges, and the number of bytes that were decompressed.
+
+  The data is inflated in chunks and only the requested ranges are kept. It
+  stops once stop(decompressed_length) returns True, or at the end of the
+  stream."""
+  d = zlib.decompressobj()
+  tail = base64.b64decode(s)
+  parts = [bytearray() for _ in ranges]
+  offset = 0
+
+  while not d.eof:
+    out = d.decompress(tail, chunk_size)
+    tail = d.unconsumed_tail
+    if not out and not tail:
+      break
+
+    for part, (start, end) in zip(parts, ranges):
+      if start < offset + len(out) and end > offset:
+        part.extend(out[max(0, start - offset):end - offset])
+    offset += len(out)
+
+    if stop is not None and stop(offset):
+      break
+
+  return parts, offset
+
 def compress(b):
   return base64.b64encode(zlib.compress(b, 9)).decode('utf-8')
 
+# Tile properties that hold the compressed blocks, boundaries, or planes
+data_properties = [
+  'blocks',
+  'boundaries',
+  'height-plane',
+  'region-plane',
+  'region-y-plane',
+  'walkable-plane',
+]
+
+def layout_dict(dict_tile, exclude=data_properties):
+  """Returns a copy of a tile dict without the excluded properties.
+
+  Only the properties that are kept are copied, so this is much cheaper than
+  copying the whole tile when only its layout (id, pos, size, y, doors,
+  regions, etc.) is needed."""
+  from copy import deepcopy
+  return {k: deepcopy(v) for k, v in dict_tile.items() if not k in exclude}
+
+def unpack_nibbles(packed):
+  """Returns a NumPy array with the 4-bit values in the given bytes, high
+  nibble first."""
+  import numpy as np
+  packed = np.frombuffer(packed, dtype=np.uint8)
+  values = np.empty(len(packed) * 2, dtype=np.uint8)
+  values[0::2] = packed >> 4
+  values[1::2] = packed & 0xf
+  return values
+
+def pack_nibbles(values):
+  """Returns the given 4-bit values packed 2 per byte, high nibble first."""
+  import numpy as np
+  values = np.frombuffer(values, dtype=np.uint8) if isinstance(values, (bytes, bytearray)) else np.asarray(values, dtype=np.uint8)
+  if len(values) % 2 == 1:
+    values = np.append(values, np.uint8(0))
+  return bytearray((values[0::2] << 4 | values[1::2] & 0xf).tobytes())
+
+def data_values(block_data, volume):
+  """Returns the first {volume} data values of a bytearray or NibbleArray as a
+  NumPy array."""
+  import numpy as np
+  if isinstance(block_data, NibbleArray):
+    return block_data.get_range(0, volume)
+  return np.frombuffer(block_data, dtype=np.uint8)[:volume]
+
+# States of tile sections, see Tile.get_section_map
+SECTION_AIR = 0
+SECTION_UNIFORM = 1
+SECTION_MIXED = 2
+
 def pairwise(iterable):
   "s -> (s0, s1), (s2, s3), (s4, s5), ..."
   a = iter(iterable)
   return zip(a, a)
 
+def union_find(n, a, b):
+  """Returns the root of each of n elements after joining a[i] and b[i] for
+  every i. The root of a group is the lowest element in it.
+
+  All edges are processed at once in each round: the higher root of every
+  edge is hooked onto the lower one, and then the paths to the roots are
+  shortened until every element points directly at its root."""
+  import numpy as np
+  parent = np.arange(n)
+  a = np.asarray(a, dtype=np.int64)
+  b = np.asarray(b, dtype=np.int64)
+  while len(a) > 0:
+    ra, rb = parent[a], parent[b]
+    keep = ra != rb
+    if not keep.any():
+      break
+    a, b, ra, rb = a[keep], b[keep], ra[keep], rb[keep]
+    np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+    while True:
+      grandparent = parent[parent]
+      if np.array_equal(grandparent, parent):
+        break
+      parent = grandparent
+  return parent
+
+
+class NibbleArray:
+  """
+  Array of 4-bit values stored 2 per byte, like the data values in the
+  blocks property of tiles. It can be indexed like a bytearray, and ranges
+  can be read and written with get_range and set_range.
+  """
+  def __init__(self, length, packed = None):
+    self.length = length
+    self.packed = bytearray(packed) if packed is not None else bytearray((length + 1) // 2)
+    if len(self.packed) < (length + 1) // 2:
+      self.packed.extend(bytes((length + 1) // 2 - len(self.packed)))
+
+  @staticmethod
+  def from_values(values):
+    """Returns a NibbleArray with the given values."""
+    return NibbleArray(len(values), pack_nibbles(values))
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return bytearray(self.get_range(0, self.length)[i].tobytes())
+    if i < 0:
+      i += self.length
+    if i & 1:
+      return self.packed[i >> 1] & 0xf
+    return self.packed[i >> 1] >> 4
+
+  def __setitem__(self, i, value):
+    if i < 0:
+      i += self.length
+    b = self.packed[i >> 1]
+    if i & 1:
+      self.packed[i >> 1] = b & 0xf0 | value & 0xf
+    else:
+      self.packed[i >> 1] = (value & 0xf) << 4 | b & 0xf
+
+  def get_range(self, start, stop):
+    """Returns the values from start to stop as a NumPy array."""
+    return unpack_nibbles(memoryview(self.packed)[start >> 1:(stop + 1) >> 1])[start & 1:stop - (start & ~1)]
+
+  def set_range(self, start, values):
+    """Sets the values starting at start to the given values."""
+    import numpy as np
+    values = np.asarray(values, dtype=np.uint8)
+    stop = start + len(values)
+    if stop <= start:
+      return
+    # Merge with the values that share a byte with the first or last value
+    first, last = start & ~1, (stop + 1) & ~1
+    merged = unpack_nibbles(memoryview(self.packed)[first >> 1:last >> 1])
+    merged[start - first:stop - first] = values
+    self.packed[first >> 1:last >> 1] = pack_nibbles(merged)
+
+  def tobytes(self):
+    """Returns the packed values."""
+    return bytes(self.packed)
+
+
+class PaletteStorage:
+  """
+  Compact block storage, similar to the block states in Minecraft chunk
+  sections. Each distinct (ID, data value) pair is stored once in a palette,
+  and each block is stored as a bit-packed index into the palette.
+
+  Indices are packed into 64-bit words without spanning two words, and the
+  number of bits per index grows when the palette gets too big for it.
+  """
+  def __init__(self, volume, bits = 1):
+    import numpy as np
+    self.volume = volume
+    self.palette = [(0, 0)] # Every block starts out as air
+    self.palette_lookup = {(0, 0): 0}
+    self.bits = bits
+    self.words = np.zeros(self.word_count(bits), dtype=np.uint64)
+
+  def word_count(self, bits):
+    return -(-self.volume // (64 // bits))
+
+  @staticmethod
+  def from_arrays(blocks, block_data):
+    """Returns a PaletteStorage object with the given block IDs and data values."""
+    import numpy as np
+    keys = np.frombuffer(blocks, dtype=np.uint16).astype(np.uint32) << 4
+    keys |= data_values(block_data, len(keys)) & 0xf
+    palette_keys, indices = np.unique(keys, return_inverse=True)
+
+    storage = PaletteStorage(len(keys), max(1, (len(palette_keys) - 1).bit_length()))
+    storage.palette = [(int(k) >> 4, int(k) & 0xf) for k in palette_keys]
+    storage.palette_lookup = {b: i for i, b in enumerate(storage.palette)}
+    storage.words = storage.pack(indices, storage.bits)
+    return storage
+
+  def to_arrays(self):
+    """Returns the block IDs and data values as an array and a bytearray."""
+    import numpy as np
+    palette = np.array(self.palette, dtype=np.uint16).reshape(-1, 2)
+    indices = self.unpack()
+    return (
+      array('H', palette[indices, 0].tobytes()),
+      bytearray(palette[indices, 1].astype(np.uint8).tobytes()))
+
+  def pack(self, indices, bits):
+    """Returns the given palette indices packed into 64-bit words."""
+    import numpy as np
+    per_word = 64 // bits
+    padded = np.zeros(self.word_count(bits) * per_word, dtype=np.uint64)
+    padded[:len(indices)] = indices
+    shifts = np.arange(per_word, dtype=np.uint64) * np.uint64(bits)
+    return np.bitwise_or.reduce(padded.reshape(-1, per_word) << shifts, axis=1)
+
+  def unpack(self):
+    """Returns all palette indices as an array."""
+    import numpy as np
+    per_word = 64 // self.bits
+    shifts = np.arange(per_word, dtype=np.uint64) * np.uint64(self.bits)
+    mask = np.uint64((1 << self.bits) - 1)
+    return ((self.words[:, np.newaxis] >> shifts) & mask).reshape(-1)[:self.volume].astype(np.intp)
+
+  def get_index(self, idx):
+    """Returns the palette index of the block at the given block index."""
+    per_word = 64 // self.bits
+    return int(self.words[idx // per_word]) >> (idx % per_word * self.bits) & ((1 << self.bits) - 1)
+
+  def get(self, idx):
+    """Returns the ID and data value of the block at the given block index."""
+    return self.palette[self.get_index(idx)]
+
+  def set(self, idx, block_id, block_data = 0):
+    """Sets the block at the given block index to the given ID and data value."""
+    key = (block_id, block_data)
+    if key in self.palette_lookup:
+      pidx = self.palette_lookup[key]
+    else:
+      pidx = len(self.palette)
+      if pidx >= 1 << self.bits:
+        # The palette doesn't fit in the current number of bits anymore
+        self.words = self.pack(self.unpack(), self.bits + 1)
+        self.bits += 1
+      self.palette.append(key)
+      self.palette_lookup[key] = pidx
+
+    per_word = 64 // self.bits
+    shift = idx % per_word * self.bits
+    word = int(self.words[idx // per_word])
+    word &= ~(((1 << self.bits) - 1) << shift)
+    self.words[idx // per_word] = word | pidx << shift
+
+  def nbytes(self):
+    """Returns roughly how many bytes the block storage uses."""
+    return self.words.nbytes + len(self.palette) * 16
+
 
 class Boundary:
   """
@@ -54,6 +310,149 @@ class Boundary:
       self.h >> 8 & 0xff, self.h & 0xff])
 
 
+# NumPy dtype of boundaries in the same format as the boundaries property of
+# tiles. It's a list of fields, so NumPy isn't imported until it's used.
+boundary_dtype = [('x', '>u2'), ('y', '>u2'), ('z', '>u2'), ('h', '>u2')]
+
+class BoundaryView(Boundary):
+  """
+  Boundary that reads and writes its properties in a BoundaryList. Views are
+  not updated when boundaries before them are removed from the list.
+  """
+  def __init__(self, boundaries, index):
+    self.boundaries = boundaries
+    self.index = index
+
+  def __get(self, field):
+    return int(self.boundaries.data[field][self.index])
+
+  def __set(self, field, value):
+    self.boundaries.data[field][self.index] = value
+
+  x = property(lambda self: self.__get('x'), lambda self, v: self.__set('x', v))
+  y = property(lambda self: self.__get('y'), lambda self, v: self.__set('y', v))
+  z = property(lambda self: self.__get('z'), lambda self, v: self.__set('z', v))
+  h = property(lambda self: self.__get('h'), lambda self, v: self.__set('h', v))
+
+
+class BoundaryList:
+  """
+  List of boundaries stored as a NumPy array with 8 bytes per boundary, in the
+  same big-endian format as the boundaries property of tiles, so the whole
+  list can be decoded or encoded at once.
+
+  It can be used like a list of Boundary objects. Indexing and iterating
+  returns BoundaryView objects, so changing their properties changes the list.
+  For fast access to all of the boundaries, use the array property.
+  """
+  def __init__(self, boundaries = ()):
+    import numpy as np
+    self.data = np.zeros(0, dtype=boundary_dtype)
+    self.length = 0
+    self.extend(boundaries)
+
+  @staticmethod
+  def from_bytes(bytes_):
+    """Returns a BoundaryList with the boundaries in the given bytes."""
+    import numpy as np
+    boundaries = BoundaryList()
+    boundaries.data = np.frombuffer(bytes_, dtype=boundary_dtype, count=len(bytes_) // 8).copy()
+    boundaries.length = len(boundaries.data)
+    return boundaries
+
+  @staticmethod
+  def from_columns(x, y, z, h):
+    """Returns a BoundaryList with the boundaries in the given arrays."""
+    import numpy as np
+    boundaries = BoundaryList()
+    boundaries.data = np.zeros(len(x), dtype=boundary_dtype)
+    boundaries.data['x'], boundaries.data['y'], boundaries.data['z'], boundaries.data['h'] = x, y, z, h
+    boundaries.length = len(x)
+    return boundaries
+
+  @staticmethod
+  def from_mask(mask):
+    """Returns a BoundaryList with a boundary for each run of True values
+    along the Y axis of a (Y, Z, X) boolean volume, in X, Z, Y order."""
+    import numpy as np
+    mask = np.asarray(mask, dtype=bool)
+    padded = np.zeros((mask.shape[0] + 2,) + mask.shape[1:], dtype=np.int8)
+    padded[1:-1] = mask
+    # Transposed to (X, Z, Y), so each column's starts and ends are in order
+    edges = np.diff(padded, axis=0).transpose(2, 1, 0)
+    x, z, y = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[2]
+    return BoundaryList.from_columns(x, y, z, ends - y)
+
+  @property
+  def array(self):
+    """Structured NumPy array with the fields x, y, z, and h."""
+    return self.data[:self.length]
+
+  def tobytes(self):
+    """Returns the boundaries as bytes, 8 bytes per boundary."""
+    return self.array.tobytes()
+
+  def __len__(self):
+    return self.length
+
+  def __iter__(self):
+    for i in range(self.length):
+      yield BoundaryView(self, i)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [BoundaryView(self, j) for j in range(self.length)[i]]
+    if i < 0:
+      i += self.length
+    if i < 0 or i >= self.length:
+      raise IndexError('boundary index out of range')
+    return BoundaryView(self, i)
+
+  def __setitem__(self, i, boundary):
+    if i < 0:
+      i += self.length
+    if i < 0 or i >= self.length:
+      raise IndexError('boundary index out of range')
+    self.data[i] = (boundary.x, boundary.y, boundary.z, boundary.h)
+
+  def __delitem__(self, i):
+    import numpy as np
+    self.data = np.delete(self.array, i)
+    self.length = len(self.data)
+
+  def append(self, boundary):
+    """Adds a boundary to the end of the list."""
+    import numpy as np
+    if self.length == len(self.data):
+      # Grow by doubling, so appending one at a time is fast
+      data = np.zeros(max(16, self.length * 2), dtype=boundary_dtype)
+      data[:self.length] = self.array
+      self.data = data
+    self.data[self.length] = (boundary.x, boundary.y, boundary.z, boundary.h)
+    self.length += 1
+
+  def extend(self, boundaries):
+    """Adds the given boundaries to the end of the list."""
+    import numpy as np
+    if isinstance(boundaries, BoundaryList):
+      added = boundaries.array
+    else:
+      added = np.array([(b.x, b.y, b.z, b.h) for b in boundaries], dtype=boundary_dtype)
+    if len(added) > 0:
+      data = np.zeros(self.length + len(added), dtype=boundary_dtype)
+      data[:self.length] = self.array
+      data[self.length:] = added
+      self.data = data
+      self.length = len(data)
+
+  def clear(self):
+    """Removes all boundaries."""
+    import numpy as np
+    self.data = np.zeros(0, dtype=boundary_dtype)
+    self.length = 0
+
+
 class Door:
   """
   Tile door, which is a tile connection or teleport point.
@@ -143,8 +542,14 @@ class Tile:
   A tile is a cuboid chunk of blocks. They are pieced together to create
   the levels in Dungeons.
 
+  Blocks are stored in an array of IDs and a bytearray of data values by
+  default. use_palette_storage switches the tile to a PaletteStorage, which
+  uses much less memory, but blocks and block_data are None while it's used.
+
+  The 'is-leaky' property is only written if write_is_leaky is True, and it
+  is computed by is_leaky when the tile is converted to a dict.
+
   Not yet implemented:
-  - 'is-leaky' property
   - 'locked' property
   - 'tags' property
   """
@@ -154,20 +559,27 @@ class Tile:
     self.volume = size[0] * size[1] * size[2]
     self.blocks = array('H', [0] * self.volume) # unsigned 16-bit int array
     self.block_data = bytearray([0] * self.volume)
+    self.palette_storage = None
     self.region_plane = bytearray([0] * (size[0] * size[2]))
     self.region_y_plane = bytearray([0] * (size[0] * size[2]))
     self.region_y_plane_copy_height = True
     self.walkable_plane = bytearray([0] * (size[0] * size[2]))
     self.write_walkable_plane = False
+    self.write_is_leaky = False
     self.y = 0
     self.pos = None
-    self.boundaries = []
+    self.boundaries = BoundaryList()
     self.doors = []
     self.regions = []
 
   @staticmethod
-  def from_dict(dict_tile):
-    """Returns a Tile object with properties from the given dict."""
+  def from_dict(dict_tile, palette_storage = False, packed_data = False):
+    """Returns a Tile object with properties from the given dict.
+
+    If palette_storage is True, the blocks are kept in a PaletteStorage.
+    If packed_data is True, block_data is a NibbleArray that keeps the data
+    values packed like they are in the dict."""
+    import numpy as np
     if 'size' in dict_tile:
       tile = Tile(dict_tile['id'], dict_tile['size'])
 
@@ -185,15 +597,20 @@ class Tile:
 
       # If the number of bytes is greater than 2 times the tile volume, the tile must be using the 16-bit format
       if len(decompressed_blocks) > tile.volume * 2:
-        # IDs are the first {tile.volume} 16-bit ints
-        tile.blocks = array('H', [x[0] << 8 | x[1] for x in pairwise(decompressed_blocks[:tile.volume*2])])
-        # Data values are only 4 bits each, so we need to split each byte in 2 and create a 1D list from that
-        tile.block_data = bytearray(chain.from_iterable([(d >> 4, d & 0xf) for d in decompressed_blocks[tile.volume*2:]]))
+        # IDs are the first {tile.volume} big-endian 16-bit ints
+        ids = np.frombuffer(decompressed_blocks, dtype='>u2', count=tile.volume)
+        data_bytes = memoryview(decompressed_blocks)[tile.volume*2:]
       else:
         # IDs are simply the first {tile.volume} bytes
-        tile.blocks = array('H', iter(decompressed_blocks[:tile.volume]))
-        # Data values are only 4 bits each, so we need to split each byte in 2 and create a 1D list from that
-        tile.block_data = bytearray(chain.from_iterable([(d >> 4, d & 0xf) for d in decompressed_blocks[tile.volume:]]))
+        ids = np.frombuffer(decompressed_blocks, dtype=np.uint8, count=tile.volume)
+        data_bytes = memoryview(decompressed_blocks)[tile.volume:]
+      tile.blocks = array('H', ids.astype(np.uint16).tobytes())
+
+      # Data values are only 4 bits each, so each byte holds 2 of them
+      if packed_data:
+        tile.block_data = NibbleArray(tile.volume, data_bytes)
+      else:
+        tile.block_data = bytearray(unpack_nibbles(data_bytes).tobytes())
 
     if 'region-plane' in dict_tile:
       tile.region_plane = bytearray(decompress(dict_tile['region-plane']))
@@ -206,6 +623,9 @@ class Tile:
       tile.walkable_plane = bytearray(decompress(dict_tile['walkable-plane']))
       tile.write_walkable_plane = True
 
+    if 'is-leaky' in dict_tile:
+      tile.write_is_leaky = True
+
     if 'y' in dict_tile:
       tile.y = dict_tile['y']
 
@@ -218,12 +638,81 @@ class Tile:
     if 'boundaries' in dict_tile:
       # Old uncompressed boundaries format
       if isinstance(dict_tile['boundaries'], list):
-        tile.boundaries = [Boundary(*b) for b in dict_tile['boundaries']]
+        tile.boundaries = BoundaryList(Boundary(*b) for b in dict_tile['boundaries'])
 
       else: # Normal compressed format
-        boundaries_bytes = decompress(dict_tile['boundaries'])
-        for i in range(0, len(boundaries_bytes), 8):
-          tile.boundaries.append(Boundary.from_bytes(boundaries_bytes[i:i+8]))
+        tile.boundaries = BoundaryList.from_bytes(decompress(dict_tile['boundaries']))
+
+    if palette_storage:
+      tile.use_palette_storage()
+
+    return tile
+
+  @staticmethod
+  def from_dict_y_range(dict_tile, y_start, y_end, packed_data = False):
+    """Returns a Tile object with only the layers from y_start up to y_end of
+    the tile in the given dict.
+
+    Blocks are stored layer by layer, so the blocks property is inflated as a
+    stream and only the bytes for the layers in the range are kept. The full
+    volume is never stored in memory. The 8-bit or 16-bit format can only be
+    told apart by the length of the data, so the stream is read until it is
+    known which one is used.
+
+    The sub-tile has the same planes as the tile, and its pos, doors, regions,
+    and boundaries are moved down by y_start. Boundaries are cut to fit the
+    sub-tile."""
+    import numpy as np
+    if 'size' in dict_tile:
+      size = dict_tile['size']
+      pos = dict_tile.get('pos')
+    elif 'pos' in dict_tile and 'pos2' in dict_tile:
+      size = [abs(a-b) + 1 for a, b in zip(dict_tile['pos'], dict_tile['pos2'])]
+      pos = [min(a, b) for a, b in zip(dict_tile['pos'], dict_tile['pos2'])]
+    else:
+      raise Exception('Tile is missing the size property.')
+
+    y_start = max(0, min(size[1], y_start))
+    y_end = max(y_start, min(size[1], y_end))
+
+    # Everything except the blocks comes from a copy of the dict with the size
+    # and position of the sub-tile
+    sub_dict = layout_dict(dict_tile, ['blocks', 'pos', 'pos2', 'size'])
+    sub_dict['size'] = [size[0], y_end - y_start, size[2]]
+    if pos != None:
+      sub_dict['pos'] = [pos[0], pos[1] + y_start, pos[2]]
+    tile = Tile.from_dict(sub_dict)
+
+    if 'blocks' in dict_tile and tile.volume > 0:
+      volume = size[0] * size[1] * size[2]
+      start = y_start * size[0] * size[2]
+      end = y_end * size[0] * size[2]
+
+      # Byte ranges of the IDs and data values for the 8-bit and 16-bit formats
+      ranges = [
+        (start, end), (volume + start // 2, volume + (end + 1) // 2),
+        (start * 2, end * 2), (volume * 2 + start // 2, volume * 2 + (end + 1) // 2)]
+      parts, length = decompress_ranges(dict_tile['blocks'], ranges,
+        stop = lambda length: length > volume * 2 and length >= ranges[3][1])
+
+      if length > volume * 2: # 16-bit format
+        ids = np.frombuffer(parts[2], dtype='>u2')
+        data_bytes = parts[3]
+      else:
+        ids = np.frombuffer(parts[0], dtype=np.uint8)
+        data_bytes = parts[1]
+      tile.blocks = array('H', ids.astype(np.uint16).tobytes())
+      data = unpack_nibbles(data_bytes)[start & 1:(start & 1) + tile.volume]
+      tile.block_data = NibbleArray.from_values(data) if packed_data else bytearray(data.tobytes())
+
+    for marker in tile.doors + tile.regions:
+      marker.pos = [marker.pos[0], marker.pos[1] - y_start, marker.pos[2]]
+
+    b = tile.boundaries.array
+    bottom = np.maximum(b['y'].astype(np.int32), y_start)
+    top = np.minimum(b['y'].astype(np.int32) + b['h'], y_end)
+    keep = bottom < top
+    tile.boundaries = BoundaryList.from_columns(b['x'][keep], bottom[keep] - y_start, b['z'][keep], (top - bottom)[keep])
 
     return tile
 
@@ -232,6 +721,7 @@ class Tile:
 
     The height-plane property is automatically generated.
     """
+    import numpy as np
     obj = {
       'id': self.id,
       'size': self.size
@@ -240,16 +730,22 @@ class Tile:
     if self.pos != None:
       obj['pos'] = self.pos
 
-    if any([x > 0xff for x in self.blocks]): # Requires 16-bit format
-      obj['blocks'] = compress(
-        bytearray(chain.from_iterable([(x >> 8, x & 0xff) for x in self.blocks])) +
-        bytearray([a << 4 | b & 0xf for a, b in zip_longest(self.block_data[::2], self.block_data[1::2], fillvalue=0)])
-      )
+    if self.palette_storage is not None:
+      blocks, block_data = self.palette_storage.to_arrays()
+    else:
+      blocks, block_data = self.blocks, self.block_data
+
+    # Data values are packed 2 per byte. A NibbleArray already stores them that way.
+    if isinstance(block_data, NibbleArray):
+      data_bytes = block_data.packed
+    else:
+      data_bytes = pack_nibbles(block_data)
+
+    ids = np.frombuffer(blocks, dtype=np.uint16)
+    if len(ids) > 0 and ids.max() > 0xff: # Requires 16-bit format
+      obj['blocks'] = compress(ids.astype('>u2').tobytes() + data_bytes)
     else: # Can use 8-bit format
-      obj['blocks'] = compress(
-        bytearray(tuple(self.blocks)) +
-        bytearray([a << 4 | b & 0xf for a, b in zip_longest(self.block_data[::2], self.block_data[1::2], fillvalue=0)])
-      )
+      obj['blocks'] = compress(ids.astype(np.uint8).tobytes() + data_bytes)
     obj['region-plane'] = compress(self.region_plane)
     obj['height-plane'] = compress(bytes(self.get_height_map()))
 
@@ -261,11 +757,15 @@ class Tile:
     if self.write_walkable_plane:
       obj['walkable-plane'] = compress(self.walkable_plane)
 
+    if self.write_is_leaky:
+      obj['is-leaky'] = self.is_leaky()
+
     if len(self.boundaries) > 0:
-      boundaries = bytearray()
-      for boundary in self.boundaries:
-        boundaries.extend(boundary.bytes())
-      obj['boundaries'] = compress(boundaries)
+      # boundaries can also be a list of Boundary objects
+      if isinstance(self.boundaries, BoundaryList):
+        obj['boundaries'] = compress(self.boundaries.tobytes())
+      else:
+        obj['boundaries'] = compress(BoundaryList(self.boundaries).tobytes())
 
     if self.y != 0:
       obj['y'] = self.y
@@ -287,9 +787,75 @@ class Tile:
     self.volume = x * y * z
     self.blocks = array('H', [0] * self.volume)
     self.block_data = bytearray([0] * self.volume)
+    self.palette_storage = None
     self.region_plane = bytearray([0] * (x * z))
     self.region_y_plane = bytearray([0] * (x * z))
 
+  def use_palette_storage(self):
+    """Moves the blocks of the tile to a PaletteStorage to save memory."""
+    if self.palette_storage is None:
+      self.palette_storage = PaletteStorage.from_arrays(self.blocks, self.block_data)
+      self.blocks = None
+      self.block_data = None
+
+  def use_array_storage(self):
+    """Moves the blocks of the tile back to the blocks and block_data arrays."""
+    if self.palette_storage is not None:
+      self.blocks, self.block_data = self.palette_storage.to_arrays()
+      self.palette_storage = None
+
+  def get_block_volume(self):
+    """Returns the block IDs as a NumPy array with the shape (y, z, x).
+
+    With array storage, the array shares memory with the blocks array."""
+    import numpy as np
+    blocks = self.palette_storage.to_arrays()[0] if self.palette_storage is not None else self.blocks
+    return np.frombuffer(blocks, dtype=np.uint16).reshape(self.size[1], self.size[2], self.size[0])
+
+  def get_data_volume(self):
+    """Returns the data values as a NumPy array with the shape (y, z, x).
+
+    With array storage, the array shares memory with the block_data bytearray,
+    unless block_data is a NibbleArray."""
+    block_data = self.palette_storage.to_arrays()[1] if self.palette_storage is not None else self.block_data
+    return data_values(block_data, self.volume).reshape(self.size[1], self.size[2], self.size[0])
+
+  def get_section_map(self, section_size = 16):
+    """Returns the state of each section of the tile, and the blocks in the
+    uniform sections.
+
+    The tile is split into cubic sections, starting at 0, 0, 0. Sections at the
+    far edges of the tile can be smaller. Both returned arrays have the shape
+    (y, z, x), with one value per section. The states are SECTION_AIR if the
+    section only has air, SECTION_UNIFORM if all of its blocks are the same, or
+    SECTION_MIXED. For uniform sections, the second array has the block as
+    ID << 4 | data value."""
+    import numpy as np
+    keys = self.get_block_volume().astype(np.uint32) << 4 | self.get_data_volume()
+
+    # Padding with the edge values doesn't change the min or max of a section
+    counts = [-(-s // section_size) for s in keys.shape]
+    keys = np.pad(keys, [(0, c * section_size - s) for c, s in zip(counts, keys.shape)], mode='edge')
+    keys = keys.reshape(counts[0], section_size, counts[1], section_size, counts[2], section_size)
+    lowest = keys.min(axis=(1, 3, 5))
+    highest = keys.max(axis=(1, 3, 5))
+
+    states = np.full(lowest.shape, SECTION_MIXED, dtype=np.uint8)
+    states[lowest == highest] = SECTION_UNIFORM
+    # Air has the ID 0, and its data value doesn't matter
+    states[highest >> 4 == 0] = SECTION_AIR
+    return states, np.where(states == SECTION_UNIFORM, lowest, 0)
+
+  def use_packed_data(self):
+    """Stores the data values in a NibbleArray, which uses half the memory."""
+    if isinstance(self.block_data, bytearray):
+      self.block_data = NibbleArray.from_values(self.block_data[:self.volume])
+
+  def use_unpacked_data(self):
+    """Stores the data values in a bytearray, with one byte per value."""
+    if isinstance(self.block_data, NibbleArray):
+      self.block_data = bytearray(self.block_data.get_range(0, self.volume).tobytes())
+
   def get_block_index(self, x, y, z):
     """Returns the index of the block at the given position.
 
@@ -303,18 +869,25 @@ class Tile:
     """Returns the ID of the block at the given position."""
 
     # We could use self.get_block_index(x, y, z) here, but this is faster
+    if self.palette_storage is not None:
+      return self.palette_storage.get((y * self.size[2] + z) * self.size[0] + x)[0]
     return self.blocks[(y * self.size[2] + z) * self.size[0] + x]
 
   def get_block_data(self, x, y, z):
     """Returns the data value of the block at the given position."""
 
     # We could use self.get_block_index(x, y, z) here, but this is faster
+    if self.palette_storage is not None:
+      return self.palette_storage.get((y * self.size[2] + z) * self.size[0] + x)[1]
     return self.block_data[(y * self.size[2] + z) * self.size[0] + x]
 
   def set_block(self, x, y, z, block_id, block_data = 0):
     """Sets the block at the given position to the given block ID and data value."""
 
     idx = (y * self.size[2] + z) * self.size[0] + x
+    if self.palette_storage is not None:
+      self.palette_storage.set(idx, block_id, block_data)
+      return
     self.blocks[idx] = block_id
     self.block_data[idx] = block_data
 
@@ -340,14 +913,138 @@ class Tile:
 
   def get_height_map(self):
     """Returns a height map of the tile as a 1D list."""
-
-    zr = range(0, self.size[2])
-    yr = range(min(self.size[1] - 1, 254), -1, -1)
-    height_map = [0] * (self.size[0] * self.size[2])
-    for x in range(0, self.size[0]):
-      for z in zr: # zr and yr are created only once above to save time
-        for y in yr: # Start at the top and go down until a solid block is found
-          if self.get_block_id(x, y, z) != 0: # Block is not air
-            height_map[z * self.size[0] + x] = y + 1
-            break
-    return height_map
\ No newline at end of file
+    import numpy as np
+
+    # Start at the top and go down until a solid block is found
+    top = min(self.size[1] - 1, 254)
+    solid = self.get_block_volume()[top::-1] != 0 if top >= 0 else np.zeros((1, self.size[2], self.size[0]), dtype=bool)
+    height_map = np.where(solid.any(axis=0), top + 1 - solid.argmax(axis=0), 0)
+    return height_map.reshape(-1).tolist()
+
+  def generate_planes(self, passable_blocks = (0,), headroom = 2, max_drop = 3):
+    """Returns a suggested region plane and walkable plane for the tile, based
+    on its blocks, as two bytearrays.
+
+    The floor of a column is the highest block that isn't in passable_blocks
+    and has headroom passable blocks above it. Blocks above the tile count as
+    passable. The walkable plane is the Y coordinate of the floor + 1, or 0 if
+    the column has no floor, like in the vanilla tiles.
+
+    In the region plane, columns without a floor, and columns with a floor more
+    than max_drop blocks below the floor of a neighbouring column, are big falls
+    (2). Columns with solid blocks above the floor are roofed (3), and the rest
+    are walkable (0). Walls are left to the blocks themselves."""
+    import numpy as np
+    size_y = self.size[1]
+    if self.volume == 0:
+      area = self.size[0] * self.size[2]
+      return bytearray([2] * area), bytearray(area)
+
+    solid = ~np.isin(self.get_block_volume(), np.asarray(passable_blocks, dtype=np.uint16))
+
+    # solid_below[y] is the number of solid blocks below y in each column, so
+    # the number in any range of a column is the difference of two layers
+    solid_below = np.zeros((size_y + 1,) + solid.shape[1:], dtype=np.int32)
+    np.cumsum(solid, axis=0, out=solid_below[1:])
+    ys = np.arange(size_y)
+    clear = solid_below[np.minimum(ys + 1 + headroom, size_y)] == solid_below[ys + 1]
+    standable = solid & clear
+
+    has_floor = standable.any(axis=0)
+    floor = size_y - 1 - standable[::-1].argmax(axis=0)
+    roofed = has_floor & (solid_below[size_y] > np.take_along_axis(solid_below, floor[np.newaxis] + 1, axis=0)[0])
+
+    # Compare each column with its 4 neighbours. Columns at the edges of the
+    # tile are compared with themselves.
+    heights = np.where(has_floor, floor, -(1 << 20))
+    padded = np.pad(heights, 1, mode='edge')
+    neighbours = np.maximum.reduce([padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]])
+    falls = ~has_floor | (neighbours - heights > max_drop)
+
+    region_plane = np.where(falls, 2, np.where(roofed, 3, 0)).astype(np.uint8)
+    walkable_plane = np.where(has_floor, np.minimum(floor + 1, 255), 0).astype(np.uint8)
+    return bytearray(region_plane.tobytes()), bytearray(walkable_plane.tobytes())
+
+  def get_wall_volume(self, passable_blocks = (0,)):
+    """Returns a boolean NumPy array with the shape (y, z, x) that is True
+    where players can't go.
+
+    Blocks that aren't in passable_blocks are walls, and so are boundaries,
+    and the parts of unwalkable region plane columns (2 and 4) that are at or
+    above the region-y plane."""
+    import numpy as np
+    size_x, size_y, size_z = self.size
+    walls = ~np.isin(self.get_block_volume(), np.asarray(passable_blocks, dtype=np.uint16))
+
+    # Boundaries are added with a +1/-1 at their bottom and top, so the sum
+    # along Y is positive inside boundaries. Only the columns with boundaries
+    # in them are summed.
+    b = self.boundaries.array if isinstance(self.boundaries, BoundaryList) else BoundaryList(self.boundaries).array
+    inside = (b['x'] < size_x) & (b['z'] < size_z)
+    columns, column_index = np.unique(b['z'][inside].astype(np.intp) * size_x + b['x'][inside], return_inverse=True)
+    bottom = np.minimum(b['y'][inside], size_y).astype(np.intp)
+    top = np.minimum(bottom + b['h'][inside], size_y)
+    edges = np.zeros((size_y + 1, len(columns)), dtype=np.int32)
+    np.add.at(edges, (bottom, column_index), 1)
+    np.add.at(edges, (top, column_index), -1)
+    walls.reshape(size_y, -1)[:, columns] |= np.cumsum(edges, axis=0)[:size_y] > 0
+
+    shape = (size_z, size_x)
+    unwalkable = np.isin(np.frombuffer(bytes(self.region_plane), dtype=np.uint8).reshape(shape), [2, 4])
+    region_y = np.frombuffer(bytes(self.region_y_plane), dtype=np.uint8).reshape(shape)
+    walls |= unwalkable & (np.arange(size_y)[:, np.newaxis, np.newaxis] >= region_y)
+    return walls
+
+  def is_leaky(self, passable_blocks = (0,)):
+    """Returns True if players can get from the doors or playerstart regions
+    of the tile to its sides anywhere other than through a door.
+
+    Players can move through every voxel that isn't a wall (see
+    get_wall_volume), in all directions. Instead of searching voxel by voxel,
+    each run of open voxels along the X axis is a node, runs that touch each
+    other along the Y or Z axis are joined with union_find, and the tile is
+    leaky if a run that is reached from a door or playerstart region is also
+    on a side of the tile outside of the doors."""
+    import numpy as np
+    if self.volume == 0:
+      return False
+
+    open_ = ~self.get_wall_volume(passable_blocks)
+
+    # Doors and playerstart regions are where the search starts, and doors are
+    # the sides that players are supposed to leave through
+    doors = np.zeros(open_.shape, dtype=bool)
+    reached = np.zeros(open_.shape, dtype=bool)
+    for marker in self.doors + [r for r in self.regions if getattr(r, 'tags', None) == 'playerstart']:
+      box = tuple(slice(max(0, marker.pos[i]), max(0, marker.pos[i] + max(1, marker.size[i]))) for i in (1, 2, 0))
+      reached[box] = True
+      if isinstance(marker, Door):
+        doors[box] = True
+    reached &= open_
+
+    exits = np.zeros(open_.shape, dtype=bool)
+    exits[:, :, 0] = exits[:, :, -1] = exits[:, 0, :] = exits[:, -1, :] = True
+    exits &= ~doors
+
+    # Number the runs of open voxels along the X axis, starting at 1
+    starts = open_.copy()
+    starts[:, :, 1:] &= ~open_[:, :, :-1]
+    ids = np.cumsum(starts.reshape(-1), dtype=np.int32).reshape(open_.shape)
+    run_count = int(ids[-1, -1, -1]) + 1
+
+    # Pairs of runs that touch along Y or Z. Neighbouring voxels in a row
+    # usually belong to the same pair of runs, so only the first voxel of each
+    # stretch where the pair is the same is used.
+    a, b = [], []
+    for lo, hi in [(np.s_[:-1], np.s_[1:]), (np.s_[:, :-1], np.s_[:, 1:])]:
+      ids_lo, ids_hi = ids[lo], ids[hi]
+      touching = open_[lo] & open_[hi]
+      first = touching.copy()
+      first[:, :, 1:] &= (ids_lo[:, :, 1:] != ids_lo[:, :, :-1]) | (ids_hi[:, :, 1:] != ids_hi[:, :, :-1]) | ~touching[:, :, :-1]
+      a.append(ids_lo[first])
+      b.append(ids_hi[first])
+    roots = union_find(run_count, np.concatenate(a), np.concatenate(b))
+
+    reached_roots = np.zeros(run_count, dtype=bool)
+    reached_roots[roots[ids[reached]]] = True
+    return bool(reached_roots[roots[ids[exits & open_]]].any())
@@ -0,0 +1,248 @@
+import json
+import zlib
+import numpy as np
+from Tile import Tile, BoundaryList, Boundary, Door, Region, decompress, compress, data_properties
+from ObjectGroupDiff import decode_blocks, tile_size
+
+"""Module for making small patches from the changes between two versions of
+an object group, and applying them to tiles that are already loaded.
+
+A patch only has the blocks and plane cells that changed. Changed voxels are
+stored as runs of consecutive block indices with the same ID and data value,
+so a box that was filled with one block is a run per row, and the run columns
+are delta coded so the rows of a box compress to almost nothing:
+
+  patch = make_patch(old_objectgroup, new_objectgroup)
+  write_patch('fix.patch', patch)
+
+  tiles = [Tile.from_dict(t) for t in old_objectgroup['objects']]
+  apply_patch(tiles, read_patch('fix.patch'))
+
+Doors, regions, boundaries, and the other tile properties are replaced as a
+whole when they change, since they are small. Tiles that were added or
+resized are stored in full.
+"""
+
+# Columns of a run of blocks: the gap since the end of the last run, the
+# length of the run, and the ID and data value of its blocks
+block_run_dtype = np.dtype([('gap', '>u4'), ('length', '>u4'), ('id', '>u2'), ('data', 'u1')])
+# Columns of a run of plane cells
+plane_run_dtype = np.dtype([('gap', '>u4'), ('length', '>u4'), ('value', 'u1')])
+
+# Planes that are applied to each Tile attribute. The height plane is left out
+# because Tile.dict generates it from the blocks.
+plane_attributes = {
+  'region-plane': 'region_plane',
+  'region-y-plane': 'region_y_plane',
+  'walkable-plane': 'walkable_plane',
+}
+
+def encode_runs(changed, values, dtype):
+  """Returns the runs of the changed values as packed bytes.
+
+  Runs are split wherever a value is not changed or it's different from the
+  value before it. The columns are stored one after another, which compresses
+  better than storing the runs one after another."""
+  index = np.flatnonzero(changed)
+  values = values[index]
+  starts = np.ones(len(index), dtype=bool)
+  starts[1:] = (index[1:] != index[:-1] + 1) | (values[1:] != values[:-1])
+  first = np.flatnonzero(starts)
+
+  runs = np.zeros(len(first), dtype=dtype)
+  runs['length'] = np.diff(np.append(first, len(index)))
+  stops = index[first] + runs['length']
+  runs['gap'] = index[first] - np.append(0, stops[:-1])
+  if 'id' in dtype.names: # Block values are ID << 4 | data value
+    runs['id'] = values[first] >> 4
+    runs['data'] = values[first] & 0xf
+  else:
+    runs['value'] = values[first]
+  return b''.join(runs[f].tobytes() for f in dtype.names)
+
+def decode_runs(compressed, dtype):
+  """Decodes packed runs from encode_runs.
+
+  Returns the block or cell index of every value in the runs, the runs as a
+  structured array, and the run that each index belongs to."""
+  raw = decompress(compressed)
+  count = len(raw) // dtype.itemsize
+  runs = np.zeros(count, dtype=dtype)
+  offset = 0
+  for field in dtype.names:
+    size = dtype.fields[field][0].itemsize * count
+    runs[field] = np.frombuffer(raw, dtype=dtype.fields[field][0], count=count, offset=offset)
+    offset += size
+
+  lengths = runs['length'].astype(np.int64)
+  offsets = np.cumsum(lengths) - lengths # Position of each run in the index array
+  starts = np.cumsum(runs['gap'].astype(np.int64)) + offsets
+  run_of_index = np.repeat(np.arange(count), lengths)
+  index = np.repeat(starts - offsets, lengths) + np.arange(len(run_of_index))
+  return index, runs, run_of_index
+
+def plane_values(dict_tile, name, cells):
+  """Returns the values of a plane of a tile dict, or None if it doesn't have it."""
+  if not name in dict_tile:
+    return None
+  return np.frombuffer(decompress(dict_tile[name]), dtype=np.uint8)[:cells]
+
+def make_tile_patch(old_tile, new_tile):
+  """Returns a patch that changes a Tile loaded from the old tile dict into the
+  new one, or None if nothing changed. Both tiles must have the same size."""
+  size = tile_size(new_tile)
+  volume = size[0] * size[1] * size[2]
+  cells = size[0] * size[2]
+  patch = {'id': new_tile['id']}
+
+  if old_tile.get('blocks') != new_tile.get('blocks'):
+    old_ids, old_data = decode_blocks(old_tile['blocks'], volume) if 'blocks' in old_tile else (np.zeros(volume, np.uint16), np.zeros(volume, np.uint8))
+    new_ids, new_data = decode_blocks(new_tile['blocks'], volume) if 'blocks' in new_tile else (np.zeros(volume, np.uint16), np.zeros(volume, np.uint8))
+    changed = (old_ids != new_ids) | (old_data != new_data)
+    if changed.any():
+      keys = new_ids.astype(np.uint32) << 4 | new_data
+      patch['blocks'] = compress(encode_runs(changed, keys, block_run_dtype))
+
+  # Tile.dict writes the height plane as the region-y plane when the tile
+  # doesn't have its own, so those tiles don't need region-y runs. The loaded
+  # tile always has its own region-y plane if the old dict has one, so the
+  # flag is needed whenever the region-y plane changed.
+  new_copies_height = not 'region-y-plane' in new_tile or new_tile['region-y-plane'] == new_tile.get('height-plane')
+  if new_copies_height and old_tile.get('region-y-plane') != new_tile.get('region-y-plane'):
+    patch['region-y-plane-copies-height'] = True
+  for name in plane_attributes:
+    if old_tile.get(name) == new_tile.get(name) or not name in new_tile:
+      continue
+    if name == 'region-y-plane' and new_copies_height:
+      continue
+    # Tile.from_dict loads the planes the old dict has as they are, so the
+    # runs are against those bytes. Missing planes get runs for every cell.
+    old_values = plane_values(old_tile, name, cells)
+    new_values = plane_values(new_tile, name, cells)
+    changed = np.ones(cells, dtype=bool) if old_values is None or len(old_values) != cells else old_values != new_values
+    if changed.any():
+      patch[name] = compress(encode_runs(changed, new_values, plane_run_dtype))
+
+  if old_tile.get('boundaries') != new_tile.get('boundaries'):
+    boundaries = new_tile.get('boundaries', '')
+    if isinstance(boundaries, list):
+      boundaries = compress(BoundaryList(Boundary(*b) for b in boundaries).tobytes())
+    patch['boundaries'] = boundaries
+
+  properties = {k: v for k, v in new_tile.items()
+    if not k in data_properties and k != 'id' and old_tile.get(k) != v}
+  if 'pos2' in new_tile and ('pos' in properties or 'pos2' in properties):
+    properties['pos'] = [min(a, b) for a, b in zip(new_tile['pos'], new_tile['pos2'])]
+  properties.pop('pos2', None)
+  removed = [k for k in old_tile if not k in new_tile and (k == 'walkable-plane' or not k in data_properties)]
+  if len(properties) > 0:
+    patch['properties'] = properties
+  if len(removed) > 0:
+    patch['removed-properties'] = removed
+
+  return patch if len(patch) > 1 else None
+
+def make_patch(old_objectgroup, new_objectgroup):
+  """Returns a patch that changes tiles loaded from the old object group into
+  the tiles of the new one."""
+  old_tiles = {t['id']: t for t in old_objectgroup.get('objects', [])}
+  new_tiles = new_objectgroup.get('objects', [])
+  new_ids = set(t['id'] for t in new_tiles)
+
+  patch = {'tiles': [], 'added': [], 'removed': [tid for tid in old_tiles if not tid in new_ids], 'order': None}
+  for tile in new_tiles:
+    old_tile = old_tiles.get(tile['id'])
+    if old_tile is None:
+      patch['added'].append(tile)
+    elif tile_size(old_tile) != tile_size(tile):
+      # Resized tiles can't be patched block by block
+      patch['removed'].append(tile['id'])
+      patch['added'].append(tile)
+    elif not old_tile is tile:
+      tile_patch = make_tile_patch(old_tile, tile)
+      if tile_patch is not None:
+        patch['tiles'].append(tile_patch)
+
+  # The order only needs to be stored if it isn't the old order with the new tiles at the end
+  removed = set(patch['removed'])
+  kept_order = [tid for tid in old_tiles if not tid in removed] + [t['id'] for t in patch['added']]
+  if kept_order != [t['id'] for t in new_tiles]:
+    patch['order'] = [t['id'] for t in new_tiles]
+  return patch
+
+def apply_tile_patch(tile, patch):
+  """Applies a patch from make_tile_patch to a Tile object in place."""
+  if 'region-y-plane-copies-height' in patch:
+    tile.region_y_plane_copy_height = True
+  elif 'region-y-plane' in patch:
+    # If the tile copied the height plane, the runs cover every cell
+    tile.region_y_plane_copy_height = False
+
+  for name, attribute in plane_attributes.items():
+    if name in patch:
+      index, runs, run_of_index = decode_runs(patch[name], plane_run_dtype)
+      np.frombuffer(getattr(tile, attribute), dtype=np.uint8)[index] = runs['value'][run_of_index]
+  if 'walkable-plane' in patch:
+    tile.write_walkable_plane = True
+
+  if 'blocks' in patch:
+    index, runs, run_of_index = decode_runs(patch['blocks'], block_run_dtype)
+    palette_storage = tile.palette_storage is not None
+    tile.use_array_storage()
+    np.frombuffer(tile.blocks, dtype=np.uint16)[index] = runs['id'][run_of_index]
+    data = runs['data'][run_of_index]
+    if isinstance(tile.block_data, bytearray):
+      np.frombuffer(tile.block_data, dtype=np.uint8)[index] = data
+    else:
+      values = tile.block_data.get_range(0, tile.volume)
+      values[index] = data
+      tile.block_data.set_range(0, values)
+    if palette_storage:
+      tile.use_palette_storage()
+
+  if 'boundaries' in patch:
+    tile.boundaries = BoundaryList.from_bytes(decompress(patch['boundaries'])) if patch['boundaries'] else BoundaryList()
+
+  properties = patch.get('properties', {})
+  for key in patch.get('removed-properties', []):
+    if key == 'walkable-plane':
+      tile.write_walkable_plane = False
+    elif key in ('doors', 'regions'):
+      setattr(tile, key, [])
+    elif key == 'y':
+      tile.y = 0
+  if 'pos' in properties:
+    tile.pos = properties['pos']
+  if 'y' in properties:
+    tile.y = properties['y']
+  if 'doors' in properties:
+    tile.doors = [Door.from_dict(d) for d in properties['doors']]
+  if 'regions' in properties:
+    tile.regions = [Region.from_dict(r) for r in properties['regions']]
+
+def apply_patch(tiles, patch):
+  """Applies a patch from make_patch to a list of Tile objects in place.
+
+  Patched tiles are changed in place, removed tiles are taken out of the list,
+  and added tiles are loaded with Tile.from_dict."""
+  removed = set(patch['removed'])
+  tiles[:] = [t for t in tiles if not t.id in removed]
+  by_id = {t.id: t for t in tiles}
+  for tile_patch in patch['tiles']:
+    apply_tile_patch(by_id[tile_patch['id']], tile_patch)
+  for dict_tile in patch['added']:
+    tile = Tile.from_dict(dict_tile)
+    tiles.append(tile)
+    by_id[tile.id] = tile
+  if patch['order'] is not None:
+    tiles[:] = [by_id[tid] for tid in patch['order']]
+
+def write_patch(path, patch):
+  """Writes a patch to a zlib-compressed JSON file."""
+  with open(path, 'wb') as out_file:
+    out_file.write(zlib.compress(json.dumps(patch, separators=(',', ':')).encode('utf-8'), 9))
+
+def read_patch(path):
+  """Reads a patch written by write_patch."""
+  with open(path, 'rb') as in_file:
+    return json.loads(zlib.decompress(in_file.read()))
@@ -0,0 +1,155 @@
+import numpy as np
+from Tile import union_find
+from MarkerIndex import MarkerIndex
+
+"""Module for finding walkable areas of tiles that players can't get to.
+
+The walkable cells of a tile's region plane (values 0, 1, and 3) are split
+into connected areas, where two neighbouring cells are connected if their
+heights differ by at most max_step blocks. Areas that no door or playerstart
+region is in are isolated:
+
+  areas = TileAreas(tile)
+  for area in areas.isolated():
+    print(area, areas.sizes[area], areas.sample(area))
+
+level_isolated_areas does the same for a whole level, where tiles are joined
+by doors that touch each other.
+"""
+
+walkable_region_values = [0, 1, 3]
+
+def label_areas(walkable, heights = None, max_step = 1):
+  """Labels the connected areas of a 2D boolean array.
+
+  Returns an array of the same shape with the area number of each walkable
+  cell, or -1 for cells that aren't walkable, and the number of areas."""
+  walkable = np.asarray(walkable, dtype=bool)
+  index = np.arange(walkable.size).reshape(walkable.shape)
+  a, b = [], []
+  for axis in range(2):
+    lo = [slice(None), slice(None)]
+    hi = [slice(None), slice(None)]
+    lo[axis], hi[axis] = slice(None, -1), slice(1, None)
+    lo, hi = tuple(lo), tuple(hi)
+    connected = walkable[lo] & walkable[hi]
+    if heights is not None:
+      connected &= np.abs(heights[lo].astype(np.int32) - heights[hi]) <= max_step
+    a.append(index[lo][connected])
+    b.append(index[hi][connected])
+  roots = union_find(walkable.size, np.concatenate(a), np.concatenate(b)).reshape(walkable.shape)
+
+  # Number the areas 0, 1, 2, ... in the order of their first cell
+  labels = np.full(walkable.shape, -1, dtype=np.int32)
+  unique_roots, numbers = np.unique(roots[walkable], return_inverse=True)
+  labels[walkable] = numbers.reshape(-1)
+  return labels, len(unique_roots)
+
+def marker_cells(tile, marker):
+  """Returns the (z, x) slices of the plane cells that a door or region covers."""
+  x0, z0 = max(0, marker.pos[0]), max(0, marker.pos[2])
+  x1 = min(tile.size[0], marker.pos[0] + max(1, marker.size[0]))
+  z1 = min(tile.size[2], marker.pos[2] + max(1, marker.size[2]))
+  return slice(z0, max(z0, z1)), slice(x0, max(x0, x1))
+
+def is_playerstart(region):
+  return getattr(region, 'tags', None) == 'playerstart' or getattr(region, 'name', None) == 'playerstart'
+
+
+class TileAreas:
+  """Connected walkable areas of a tile.
+
+  Heights come from the walkable plane if the tile has one, or from the
+  height map if it doesn't."""
+  def __init__(self, tile, max_step = 1):
+    self.tile = tile
+    shape = (tile.size[2], tile.size[0])
+    walkable = np.isin(np.frombuffer(bytes(tile.region_plane), dtype=np.uint8).reshape(shape), walkable_region_values)
+    if tile.write_walkable_plane:
+      heights = np.frombuffer(bytes(tile.walkable_plane), dtype=np.uint8).reshape(shape)
+    else:
+      heights = np.asarray(tile.get_height_map()).reshape(shape)
+    self.labels, self.count = label_areas(walkable, heights, max_step)
+    self.sizes = np.bincount(self.labels[walkable], minlength=self.count)
+    labels, first_cells = np.unique(self.labels.reshape(-1), return_index=True)
+    self.first_cells = first_cells[labels >= 0]
+
+    # Areas with each door in them, and areas that are reached from the tile's doors or playerstart
+    self.door_areas = [self.areas_in(d) for d in tile.doors]
+    self.reached = set(a for areas in self.door_areas for a in areas)
+    for r in tile.regions:
+      if is_playerstart(r):
+        self.reached.update(self.areas_in(r))
+
+  def areas_in(self, marker):
+    """Returns the areas that a door or region covers."""
+    labels = self.labels[marker_cells(self.tile, marker)]
+    return set(np.unique(labels[labels >= 0]).tolist())
+
+  def isolated(self):
+    """Returns the areas that aren't reached from a door or playerstart region."""
+    return [a for a in range(self.count) if not a in self.reached]
+
+  def sample(self, area):
+    """Returns the [x, z] position of the first cell of an area."""
+    z, x = divmod(int(self.first_cells[area]), self.tile.size[0])
+    return [x, z]
+
+
+def level_isolated_areas(tiles, max_step = 1):
+  """Returns the walkable areas of a level that players can't get to.
+
+  Doors of different tiles that touch or overlap in world coordinates are
+  connected, which joins the areas they are in. Everything that is connected
+  to an area with a playerstart region can be reached. If the level doesn't
+  have a playerstart region, the biggest group of connected areas is used.
+
+  Returns a list of dicts with the tile, area, number of cells, and a sample
+  [x, z] position in the tile for each area that can't be reached."""
+  tiles = list(tiles)
+  tile_areas = [TileAreas(t, max_step) for t in tiles]
+  offsets = np.cumsum([0] + [ta.count for ta in tile_areas])
+
+  tile_numbers = {id(t): i for i, t in enumerate(tiles)}
+  a, b = [], []
+  index = MarkerIndex(tiles)
+  for ti, ta in enumerate(tile_areas):
+    tpos = ta.tile.pos or [0, 0, 0]
+    for door, areas in zip(ta.tile.doors, ta.door_areas):
+      if len(areas) == 0:
+        continue
+      # Doors that touch this door's box are found by growing it by one block
+      pos = [p + t - 1 for p, t in zip(door.pos, tpos)]
+      size = [max(1, s) + 2 for s in door.size]
+      for match in index.in_box(pos, size, kind='door'):
+        if match.tile is ta.tile:
+          continue
+        oi = tile_numbers[id(match.tile)]
+        other_areas = tile_areas[oi].areas_in(match.marker)
+        for area in areas:
+          for other_area in other_areas:
+            a.append(offsets[ti] + area)
+            b.append(offsets[oi] + other_area)
+
+  roots = union_find(offsets[-1], a, b)
+
+  start = set()
+  for ti, ta in enumerate(tile_areas):
+    for r in ta.tile.regions:
+      if is_playerstart(r):
+        start.update(roots[offsets[ti] + area] for area in ta.areas_in(r))
+  if len(start) == 0 and offsets[-1] > 0:
+    sizes = np.concatenate([ta.sizes for ta in tile_areas])
+    start.add(np.bincount(roots, weights=sizes).argmax())
+
+  isolated = []
+  for ti, ta in enumerate(tile_areas):
+    for area in range(ta.count):
+      if not roots[offsets[ti] + area] in start:
+        isolated.append({
+          'tile': ta.tile.id,
+          'area': area,
+          'cells': int(ta.sizes[area]),
+          'sample': ta.sample(area),
+        })
+  return isolated
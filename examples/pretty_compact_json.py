@@ -37,19 +37,59 @@ def stringify(passedObj, indent=2, max_length=80):
   if indent == 0:
     max_length = float('inf')
 
+  # Compact length and number of brackets of each container, by id. Leaves
+  # also keep their JSON string, so big strings are only serialized once.
+  measured = {}
+
+  def _measure(obj):
+    """Returns (length, brackets, string) for obj without building the whole
+    compact string. string is only set for leaves."""
+    key = id(obj)
+    if key in measured:
+      return measured[key]
+
+    if isinstance(obj, dict) and all(isinstance(k, str) for k in obj):
+      length = 2 + 2 * max(0, len(obj) - 1)
+      brackets = 2
+      for k, v in obj.items():
+        key_string = json.dumps(k)
+        child_length, child_brackets, _ = _measure(v)
+        length += len(key_string) + 2 + child_length
+        brackets += key_string.count('{') + key_string.count('[') + key_string.count('}') + key_string.count(']') + child_brackets
+      result = (length, brackets, None)
+
+    elif isinstance(obj, (list, tuple)):
+      length = 2 + 2 * max(0, len(obj) - 1)
+      brackets = 2
+      for v in obj:
+        child_length, child_brackets, _ = _measure(v)
+        length += child_length
+        brackets += child_brackets
+      result = (length, brackets, None)
+
+    else: # Leaves, and dicts with keys that json converts to strings
+      string = json.dumps(obj, separators=(', ', ': '))
+      brackets = string.count('{') + string.count('[') + string.count('}') + string.count(']')
+      result = (len(string), brackets, string)
+
+    measured[key] = result
+    return result
+
   def _stringify(obj, current_indent, reserved, has_key):
     # The original code checks if obj has a toJSON function here and uses that
     # to convert obj to JSON before continuing. It's not really necessary for
     # what I use this function for, so I decided to just remove it.
 
-    string = json.dumps(obj, separators=(', ', ': '))
+    string_length, brackets, string = _measure(obj)
 
     length = max_length - len(current_indent) - reserved
 
-    if len(string) <= length:
-      prettified = re.sub(start_or_end, r'\1 \2', string)
-      if len(prettified) <= length:
-        return prettified
+    # The prettified string has a space after each opening bracket and before
+    # each closing bracket, so its length is known without building it
+    if string_length + brackets <= length:
+      if string is None:
+        string = json.dumps(obj, separators=(', ', ': '))
+      return re.sub(start_or_end, r'\1 \2', string)
 
     if isinstance(obj, dict) or isinstance(obj, list):
       next_indent = current_indent + indent_str
@@ -80,6 +120,8 @@ def stringify(passedObj, indent=2, max_length=80):
         else:
           return f'\n{current_indent}'.join([start + indent_str[1:] + items[0] + ',', indent_str + f',\n{next_indent}'.join(items[1:]), end])
 
+    if string is None:
+      string = json.dumps(obj, separators=(', ', ': '))
     return string
 
   return _stringify(passedObj, '', 0, False)
\ No newline at end of file